@@ -0,0 +1,452 @@
+#    Copyright 2018, 2019 Dmirty Pritykin, 2018, 2019 S520
+#
+#    This file is part of blenderCSV.
+#
+#    blenderCSV is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    blenderCSV is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with blenderCSV.  If not, see <http://www.gnu.org/licenses/>.
+
+import bpy
+from . import logger
+from . import attach_file_handler
+
+loggingLevels = (
+    ("NOTSET", "NOTSET", ""),
+    ("DEBUG", "DEBUG", ""),
+    ("INFO", "INFO", ""),
+    ("WARNING", "WARNING", ""),
+    ("ERROR", "ERROR", ""),
+    ("CRITICAL", "CRITICAL", "")
+)
+
+encodings = (
+    ("AUTO", "Auto detect", "Detect the encoding from the byte order mark or the file content"),
+    ("utf-8", "UTF-8", ""),
+    ("shift_jis", "Shift_JIS", ""),
+    ("cp1251", "Windows-1251", ""),
+    ("cp1252", "Windows-1252", ""),
+    ("gb18030", "GB18030", ""),
+    ("big5", "Big5", ""),
+    ("euc-kr", "EUC-KR", "")
+)
+
+
+class CsvImporter(bpy.types.Operator):
+    bl_idname = "import_scene.csv"
+    bl_label = "OpenBVE CSV model (*.csv)"
+    bl_options = {"REGISTER", "UNDO"}
+
+    filepath = bpy.props.StringProperty(subtype="FILE_PATH")
+
+    use_loggingLevel = bpy.props.EnumProperty(
+        items=loggingLevels,
+        name="Set logging level",
+        description="Set logging level",
+        default="INFO"
+    )
+
+    use_transform_coords = bpy.props.BoolProperty(
+        name="Transform coordinates",
+        description="Transformation from OpenBVE left crew coordinate system",
+        default=True
+    )
+
+    use_split_add_face2 = bpy.props.BoolProperty(
+        name="Split AddFace2",
+        description="Splits the face generated by the AddFace2 command",
+        default=False
+    )
+
+    encoding = bpy.props.EnumProperty(
+        items=encodings,
+        name="Encoding",
+        description="Character encoding of the CSV file",
+        default="AUTO"
+    )
+
+    use_cache = bpy.props.BoolProperty(
+        name="Use cache",
+        description="Reuse the parsed model cached from a previous import of the same file",
+        default=True
+    )
+
+    use_merge_meshes = bpy.props.BoolProperty(
+        name="Merge meshes",
+        description="Import all mesh builders of the file as one object with a material slot per builder",
+        default=False
+    )
+
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {"RUNNING_MODAL"}
+
+    def execute(self, context):
+        attach_file_handler()
+        logger.setLevel(self.use_loggingLevel)
+        logger.info("Import started.")
+
+        from . import ImportCSV
+        importer = ImportCSV.ImportCsv()
+
+        importer.option.use_transform_coords = self.use_transform_coords
+        importer.option.use_split_add_face2 = self.use_split_add_face2
+        importer.option.encoding = "" if self.encoding == "AUTO" else self.encoding
+        importer.option.use_cache = self.use_cache
+        importer.option.use_merge_meshes = self.use_merge_meshes
+
+        importer.import_model(self.filepath)
+
+        logger.info("Import completed.")
+        return {"FINISHED"}
+
+
+class CsvExporter(bpy.types.Operator):
+    bl_idname = "export_scene.csv"
+    bl_label = "OpenBVE CSV model (*.csv)"
+    bl_options = {"REGISTER"}
+
+    filename_ext = ".csv"
+
+    filter_glob = bpy.props.StringProperty(
+        default="*.csv",
+        options={"HIDDEN"}
+    )
+
+    filepath = bpy.props.StringProperty(subtype="FILE_PATH")
+
+    use_loggingLevel = bpy.props.EnumProperty(
+        items=loggingLevels,
+        name="Set logging level",
+        description="Set logging level",
+        default="INFO"
+    )
+
+    use_transform_coords = bpy.props.BoolProperty(
+        name="Transform coordinates",
+        description="Transformation to OpenBVE left crew coordinate system",
+        default=True
+    )
+
+    global_mesh_scale = bpy.props.FloatProperty(
+        name="Set global scale",
+        description="Global scale of the all scene objects",
+        default=1.0,
+        min=0.0001,
+        max=10000.0,
+    )
+
+    use_normals = bpy.props.BoolProperty(
+        name="Output Normals",
+        description="Output normals",
+        default=True
+    )
+
+    use_copy_texture_separate_directory = bpy.props.BoolProperty(
+        name="Copy textures in separate folder",
+        description="Copied textures in directory near *.csv file. Directory name will be: <model name>-textures",
+        default=True
+    )
+
+    use_hardlink_textures = bpy.props.BoolProperty(
+        name="Hardlink textures",
+        description="Create hard links instead of copies in the textures folder where the file system allows it",
+        default=False
+    )
+
+    texcoords_tolerance = bpy.props.FloatProperty(
+        name="UV merge tolerance",
+        description="Merge texture coordinates of a vertex that round to the same multiple of this value. 0 merges only identical ones",
+        default=0.0,
+        min=0.0,
+        max=1.0,
+        precision=6
+    )
+
+    use_weld_vertices = bpy.props.BoolProperty(
+        name="Weld vertices",
+        description="Share one vertex between faces whose corners have the same position, normal and UV",
+        default=False
+    )
+
+    weld_epsilon = bpy.props.FloatProperty(
+        name="Weld distance",
+        description="Maximum difference of position, normal and UV for welding vertices",
+        default=0.00001,
+        min=0.0,
+        max=1.0,
+        precision=6
+    )
+
+    use_pair_add_face2 = bpy.props.BoolProperty(
+        name="Pair double-sided faces",
+        description="Write coincident faces with opposite winding as one AddFace2",
+        default=False
+    )
+
+    max_vertices = bpy.props.IntProperty(
+        name="Max vertices per mesh",
+        description="Material groups with more vertices are split into several mesh builders",
+        default=65535,
+        min=3,
+        max=65535
+    )
+
+    coordinate_precision = bpy.props.IntProperty(
+        name="Coordinate precision",
+        description="Number of decimal places of vertex coordinates",
+        default=6,
+        min=1,
+        max=15
+    )
+
+    normal_precision = bpy.props.IntProperty(
+        name="Normal precision",
+        description="Number of decimal places of normals",
+        default=6,
+        min=1,
+        max=15
+    )
+
+    texcoords_precision = bpy.props.IntProperty(
+        name="UV precision",
+        description="Number of decimal places of texture coordinates",
+        default=6,
+        min=1,
+        max=15
+    )
+
+    def invoke(self, context, event):
+        self.filepath = "undefined" + self.filename_ext
+        context.window_manager.fileselect_add(self)
+        return {"RUNNING_MODAL"}
+
+    def execute(self, context):
+        if bpy.context.mode != "OBJECT":
+            def draw_context(self, context):
+                self.layout.label("Please switch to Object Mode.")
+
+            bpy.context.window_manager.popup_menu(draw_context, title="Export CSV", icon="ERROR")
+            return {"FINISHED"}
+
+        attach_file_handler()
+        logger.setLevel(self.use_loggingLevel)
+        logger.info("Export started.")
+
+        from . import ExportCSV
+        exporter = ExportCSV.ExportCsv()
+
+        exporter.option.use_transform_coords = self.use_transform_coords
+        exporter.option.global_mesh_scale = self.global_mesh_scale
+        exporter.option.use_normals = self.use_normals
+        exporter.option.use_copy_texture_separate_directory = self.use_copy_texture_separate_directory
+        exporter.option.use_hardlink_textures = self.use_hardlink_textures
+        exporter.option.texcoords_tolerance = self.texcoords_tolerance
+        exporter.option.use_weld_vertices = self.use_weld_vertices
+        exporter.option.weld_epsilon = self.weld_epsilon
+        exporter.option.use_pair_add_face2 = self.use_pair_add_face2
+        exporter.option.max_vertices = self.max_vertices
+        exporter.option.coordinate_precision = self.coordinate_precision
+        exporter.option.normal_precision = self.normal_precision
+        exporter.option.texcoords_precision = self.texcoords_precision
+
+        exporter.export_model(self.filepath)
+
+        logger.info("Export completed.")
+        return {"FINISHED"}
+
+
+class CsvMeshProperties(bpy.types.PropertyGroup):
+    use_emissive_color = bpy.props.BoolProperty(
+        name="Use SetEmissiveColor",
+        description="Use SetEmissiveColor command",
+        default=False
+    )
+
+    emissive_color = bpy.props.FloatVectorProperty(
+        name="Color",
+        description="Set SetEmissiveColor command's Red, Green and Blue",
+        default=(0.0, 0.0, 0.0),
+        min=0.0,
+        max=1.0,
+        subtype="COLOR"
+    )
+
+    blend_mode = bpy.props.EnumProperty(
+        items=(("Normal", "Normal", ""), ("Additive", "Additive", "")),
+        name="BlendMode",
+        description="Set SetBlendMode command's BlendMode",
+        default="Normal"
+    )
+
+    glow_half_distance = bpy.props.IntProperty(
+        name="GlowHalfDistance",
+        description="Set SetBlendMode command's GlowHalfDistance",
+        default=0,
+        min=0,
+        max=4095
+    )
+
+    glow_attenuation_mode = bpy.props.EnumProperty(
+        items=(("DivideExponent2", "DivideExponent2", ""), ("DivideExponent4", "DivideExponent4", "")),
+        name="GlowAttenuationMode",
+        description="Set SetBlendMode command's GlowAttenuationMode",
+        default="DivideExponent4"
+    )
+
+    use_transparent_color = bpy.props.BoolProperty(
+        name="Use SetDecalTransparentColor",
+        description="Use SetDecalTransparentColor command",
+        default=False
+    )
+
+    transparent_color = bpy.props.FloatVectorProperty(
+        name="Color",
+        description="Set SetDecalTransparentColor command's Red, Green and Blue",
+        default=(0.0, 0.0, 0.0),
+        min=0.0,
+        max=1.0,
+        subtype="COLOR"
+    )
+
+
+class CsvMaterialProperties(bpy.types.PropertyGroup):
+    use_add_face2 = bpy.props.BoolProperty(
+        name="Use AddFace2",
+        description="Use AddFace2 command for generate faces in OpenBVE",
+        default=False
+    )
+
+    nighttime_texture_file = bpy.props.StringProperty(
+        name="NighttimeTexture",
+        description="Set NighttimeTexture command's LoadTexture",
+        default="",
+        subtype="FILE_PATH"
+    )
+
+    use_mesh_props = bpy.props.BoolProperty(
+        name="Override object properties",
+        description="Use the following properties instead of the object's ones for the faces with this material",
+        default=False
+    )
+
+    mesh_props = bpy.props.PointerProperty(type=CsvMeshProperties)
+
+
+def draw_mesh_props(layout, props):
+    layout.label("SetEmissiveColor:")
+    layout.prop(props, "use_emissive_color")
+    layout.prop(props, "emissive_color")
+    layout.separator()
+    layout.label("SetBlendMode:")
+    layout.prop(props, "blend_mode")
+    layout.prop(props, "glow_half_distance")
+    layout.prop(props, "glow_attenuation_mode")
+    layout.separator()
+    layout.label("SetDecalTransparentColor:")
+    layout.prop(props, "use_transparent_color")
+    layout.prop(props, "transparent_color")
+
+
+class CsvMeshPanel(bpy.types.Panel):
+    bl_label = "Additional properties for CSV mesh"
+    bl_context = "object"
+    bl_space_type = "PROPERTIES"
+    bl_region_type = "WINDOW"
+
+    @classmethod
+    def poll(cls, context):
+        return context.object and context.object.type == "MESH"
+
+    def draw(self, context):
+        draw_mesh_props(self.layout, context.object.csv_props)
+
+
+class CsvMaterialPanel(bpy.types.Panel):
+    bl_label = "Additional properties for CSV mesh"
+    bl_context = "material"
+    bl_space_type = "PROPERTIES"
+    bl_region_type = "WINDOW"
+
+    @classmethod
+    def poll(cls, context):
+        return context.material
+
+    def draw(self, context):
+        self.layout.prop(context.material.csv_props, "use_add_face2")
+        self.layout.separator()
+        self.layout.label("LoadTexture:")
+        self.layout.prop(context.material.csv_props, "nighttime_texture_file")
+        self.layout.separator()
+        self.layout.prop(context.material.csv_props, "use_mesh_props")
+
+        if context.material.csv_props.use_mesh_props:
+            draw_mesh_props(self.layout, context.material.csv_props.mesh_props)
+
+
+def menu_import(self, context):
+    self.layout.operator(CsvImporter.bl_idname, text=CsvImporter.bl_label)
+
+
+def menu_export(self, context):
+    self.layout.operator(CsvExporter.bl_idname, text=CsvExporter.bl_label)
+
+
+SESSION_HANDLERS = (bpy.app.handlers.load_post, bpy.app.handlers.undo_post, bpy.app.handlers.redo_post)
+
+
+def register():
+    bpy.utils.register_class(CsvImporter)
+    bpy.types.INFO_MT_file_import.append(menu_import)
+
+    bpy.utils.register_class(CsvExporter)
+    bpy.types.INFO_MT_file_export.append(menu_export)
+
+    bpy.utils.register_class(CsvMeshProperties)
+    bpy.types.Object.csv_props = bpy.props.PointerProperty(type=CsvMeshProperties)
+
+    bpy.utils.register_class(CsvMaterialProperties)
+    bpy.types.Material.csv_props = bpy.props.PointerProperty(type=CsvMaterialProperties)
+
+    bpy.utils.register_class(CsvMeshPanel)
+
+    bpy.utils.register_class(CsvMaterialPanel)
+
+    from . import ImportCSV
+
+    for handlers in SESSION_HANDLERS:
+        handlers.append(ImportCSV.clear_session_caches)
+
+
+def unregister():
+    from . import ImportCSV
+
+    for handlers in SESSION_HANDLERS:
+        if ImportCSV.clear_session_caches in handlers:
+            handlers.remove(ImportCSV.clear_session_caches)
+
+    bpy.utils.unregister_class(CsvImporter)
+    bpy.types.INFO_MT_file_import.remove(menu_import)
+
+    bpy.utils.unregister_class(CsvExporter)
+    bpy.types.INFO_MT_file_export.remove(menu_export)
+
+    # CsvMaterialProperties refers to CsvMeshProperties, so it goes first.
+    del bpy.types.Material.csv_props
+    bpy.utils.unregister_class(CsvMaterialProperties)
+
+    bpy.utils.unregister_class(CsvMeshProperties)
+    del bpy.types.Object.csv_props
+
+    bpy.utils.unregister_class(CsvMeshPanel)
+
+    bpy.utils.unregister_class(CsvMaterialPanel)
+
@@ -0,0 +1,126 @@
+#    Copyright 2018, 2019 Dmirty Pritykin, 2019 S520
+#
+#    This file is part of blenderCSV.
+#
+#    blenderCSV is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    blenderCSV is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with blenderCSV.  If not, see <http://www.gnu.org/licenses/>.
+
+# Parses a directory tree of OpenBVE CSV objects outside of Blender and writes per-file statistics as JSON lines.
+#
+# Usage: python -m io_scene_csv.BatchCSV [-j JOBS] [-o OUTPUT] [--split-add-face2] [--encoding ENCODING] DIRECTORY...
+
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+import sys
+import time
+from typing import Dict, Iterator, List
+from . import CSV
+
+
+class LogCounter(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__(logging.WARNING)
+        self.warnings = 0
+        self.errors = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.levelno >= logging.ERROR:
+            self.errors += 1
+        else:
+            self.warnings += 1
+
+
+def find_csv_files(directories: List[str]) -> Iterator[str]:
+    for directory in directories:
+        for dir_path, dir_names, file_names in os.walk(directory):
+            dir_names.sort()
+
+            for file_name in sorted(file_names):
+                if file_name.lower().endswith(".csv"):
+                    yield os.path.join(dir_path, file_name)
+
+
+def parse_file(file_path: str, use_split_add_face2: bool, encoding: str) -> Dict[str, object]:
+    option = CSV.ImportOption()
+    option.use_split_add_face2 = use_split_add_face2
+    option.encoding = encoding
+    option.use_numpy = False
+    option.use_compact_mesh = False
+
+    counter = LogCounter()
+    CSV.logger.addHandler(counter)
+
+    try:
+        start = time.perf_counter()
+        meshes_list = CSV.CsvObject().load_csv(option, file_path)
+        parse_time = time.perf_counter() - start
+    finally:
+        CSV.logger.removeHandler(counter)
+
+    return {
+        "path": file_path,
+        "meshes": len(meshes_list),
+        "vertices": sum(len(mesh.vertex_list) for mesh in meshes_list),
+        "faces": sum(len(mesh.faces_list) for mesh in meshes_list),
+        "warnings": counter.warnings,
+        "errors": counter.errors,
+        "parse_time": round(parse_time, 6)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Parse OpenBVE CSV objects in parallel and write per-file statistics as JSON lines.")
+    parser.add_argument("directories", nargs="+", help="directories searched recursively for *.csv files")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("-o", "--output", default="-", help="output file for the JSON lines (default: standard output)")
+    parser.add_argument("--split-add-face2", action="store_true", help="split the faces generated by AddFace2")
+    parser.add_argument("--encoding", default="", help="force the encoding of all files instead of detecting it")
+    args = parser.parse_args()
+
+    # Only the messages counted by LogCounter are needed from the parser.
+    CSV.logger.setLevel(logging.WARNING)
+
+    file_paths = list(find_csv_files(args.directories))
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    total_errors = 0
+    start = time.perf_counter()
+
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            futures = {executor.submit(parse_file, file_path, args.split_add_face2, args.encoding): file_path for file_path in file_paths}
+
+            for future in concurrent.futures.as_completed(futures):
+                # A file that makes the parser or its worker process fail is reported instead of aborting the run.
+                try:
+                    statistics = future.result()
+                except Exception as ex:
+                    statistics = {
+                        "path": futures[future],
+                        "errors": 1,
+                        "exception": type(ex).__name__ + ": " + str(ex)
+                    }
+
+                total_errors += statistics["errors"]
+                output.write(json.dumps(statistics, ensure_ascii=False) + "\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print("Parsed " + str(len(file_paths)) + " files with " + str(total_errors) + " errors in " + str(round(time.perf_counter() - start, 2)) + " s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -15,15 +15,64 @@
 #    You should have received a copy of the GNU General Public License
 #    along with blenderCSV.  If not, see <http://www.gnu.org/licenses/>.
 
+import array
+import codecs
+import itertools
+import logging
 import math
 import os
 import pathlib
-from typing import List, Tuple
-from .chardet import chardet
-from . import logger
+import re
+from typing import Callable, Dict, Iterator, List, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# The same line boundaries as str.splitlines()
+LINE_BREAK = re.compile("\r\n|[\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]")
+
+IMAGE_EXTENSIONS = (".bmp", ".gi", ".jpg", ".jpeg", ".png")
+
+# UTF-32 must be checked before UTF-16 because their little endian BOMs share a prefix
+BYTE_ORDER_MARKS = (
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF32_LE, "utf-32-le"),
+    (codecs.BOM_UTF32_BE, "utf-32-be"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be")
+)
+
+NON_ASCII_BYTE = re.compile(b"[\x80-\xff]")
+
+# Size of the leading part of a file and of the extra non-ASCII lines given to chardet
+ENCODING_SAMPLE_SIZE = 64 * 1024
+
+# Buffer size of the exported file
+EXPORT_BUFFER_SIZE = 1024 * 1024
+
+# Trailing zeros after the decimal point of a field, and the decimal point when nothing is left after it.
+# Only valid for text whose fields are all fixed point numbers.
+TRAILING_ZEROS = re.compile(r"(\.\d*?)0+(?=[,\n])")
+
+TRAILING_POINT = re.compile(r"\.(?=[,\n])")
+
+NEGATIVE_ZERO = re.compile(r"(?<!\S)-0(?=[,\n])")
+
+# 3x4 affine transform in row-major order
+Matrix = Tuple[float, float, float, float, float, float, float, float, float, float, float, float]
+
+IDENTITY_MATRIX = (1.0, 0.0, 0.0, 0.0,
+                   0.0, 1.0, 0.0, 0.0,
+                   0.0, 0.0, 1.0, 0.0)  # type: Matrix
 
 
 class CsvMesh:
+    __slots__ = ("name", "vertex_list", "normals_list", "use_add_face2", "faces_list", "diffuse_color", "use_emissive_color", "emissive_color", "blend_mode", "glow_half_distance", "glow_attenuation_mode", "daytime_texture_file", "nighttime_texture_file", "use_transparent_color", "transparent_color", "texcoords_list")
+
     def __init__(self) -> None:
         self.name = ""
         self.vertex_list = []   # type: List[Tuple[float, float, float]]
@@ -42,11 +91,160 @@ class CsvMesh:
         self.transparent_color = (0, 0, 0)  # type: Tuple[int, int, int]
         self.texcoords_list = []  # type: List[Tuple[int, float, float]]
 
+    @classmethod
+    def from_mesh(cls, mesh: "CsvMesh") -> "CsvMesh":
+        new_mesh = cls()
+
+        for key in CsvMesh.__slots__:
+            value = getattr(mesh, key)
+
+            # The views of NumpyCsvMesh and ArrayCsvMesh are tuples, but a list based mesh is edited in place.
+            if key.endswith("_list") and type(value) is tuple:
+                value = list(value)
+
+            setattr(new_mesh, key, value)
+
+        return new_mesh
+
+
+class NumpyCsvMesh(CsvMesh):
+    # Stores the geometry in NumPy arrays instead of lists of tuples.
+    # The *_list attributes are kept as read-only tuples built from the arrays. Assigning a list replaces the arrays.
+    __slots__ = ("vertices", "normals", "face_indices", "face_offsets", "texcoord_indices", "texcoords")
+
+    def __init__(self) -> None:
+        self.vertices = numpy.zeros((0, 3))
+        self.normals = numpy.zeros((0, 3))
+        self.face_indices = numpy.zeros(0, numpy.int32)
+        self.face_offsets = numpy.zeros(1, numpy.int32)
+        self.texcoord_indices = numpy.zeros(0, numpy.int32)
+        self.texcoords = numpy.zeros((0, 2))
+        super().__init__()
+
+    @property
+    def vertex_list(self) -> Tuple[Tuple[float, float, float], ...]:
+        return tuple(tuple(vertex) for vertex in self.vertices.tolist())
+
+    @vertex_list.setter
+    def vertex_list(self, vertex_list: List[Tuple[float, float, float]]) -> None:
+        self.vertices = numpy.array(vertex_list, numpy.float64).reshape(-1, 3)
+
+    @property
+    def normals_list(self) -> Tuple[Tuple[float, float, float], ...]:
+        return tuple(tuple(normal) for normal in self.normals.tolist())
+
+    @normals_list.setter
+    def normals_list(self, normals_list: List[Tuple[float, float, float]]) -> None:
+        self.normals = numpy.array(normals_list, numpy.float64).reshape(-1, 3)
+
+    @property
+    def faces_list(self) -> Tuple[Tuple[int, ...], ...]:
+        indices = self.face_indices.tolist()
+        offsets = self.face_offsets.tolist()
+
+        return tuple(tuple(indices[offsets[i]:offsets[i + 1]]) for i in range(len(offsets) - 1))
+
+    @faces_list.setter
+    def faces_list(self, faces_list: List[Tuple[int, ...]]) -> None:
+        self.face_indices = numpy.array([i for face in faces_list for i in face], numpy.int32)
+        self.face_offsets = numpy.zeros(len(faces_list) + 1, numpy.int32)
+        numpy.cumsum([len(face) for face in faces_list], out=self.face_offsets[1:])
+
+    @property
+    def texcoords_list(self) -> Tuple[Tuple[int, float, float], ...]:
+        return tuple((i, uv[0], uv[1]) for i, uv in zip(self.texcoord_indices.tolist(), self.texcoords.tolist()))
+
+    @texcoords_list.setter
+    def texcoords_list(self, texcoords_list: List[Tuple[int, float, float]]) -> None:
+        self.texcoord_indices = numpy.array([texcoords[0] for texcoords in texcoords_list], numpy.int32)
+        self.texcoords = numpy.array([texcoords[1:] for texcoords in texcoords_list], numpy.float64).reshape(-1, 2)
+
+    def transform_vertices(self, m: Matrix) -> None:
+        a = numpy.array(m).reshape(3, 4)
+        self.vertices = numpy.dot(self.vertices, a[:, :3].T) + a[:, 3]
+
+    def reverse_faces(self) -> None:
+        lengths = numpy.diff(self.face_offsets)
+        face_starts = numpy.repeat(self.face_offsets[:-1], lengths)
+        face_ends = numpy.repeat(self.face_offsets[1:], lengths)
+        self.face_indices = self.face_indices[face_starts + face_ends - 1 - numpy.arange(len(self.face_indices))]
+
+
+class ArrayCsvMesh(CsvMesh):
+    # Stores the geometry in flat array.array buffers for environments without NumPy.
+    # A vertex takes 24 bytes here instead of about 136 bytes as a tuple of three floats in a list.
+    # The *_list attributes are kept as read-only tuples built from the buffers. Assigning a list replaces the buffers.
+    __slots__ = ("vertices", "normals", "face_indices", "face_offsets", "texcoord_indices", "texcoords")
+
+    def __init__(self) -> None:
+        self.vertices = array.array("d")
+        self.normals = array.array("d")
+        self.face_indices = array.array("I")
+        self.face_offsets = array.array("I", (0,))
+        self.texcoord_indices = array.array("I")
+        self.texcoords = array.array("d")
+        super().__init__()
+
+    @property
+    def vertex_list(self) -> Tuple[Tuple[float, float, float], ...]:
+        return tuple(zip(self.vertices[0::3], self.vertices[1::3], self.vertices[2::3]))
+
+    @vertex_list.setter
+    def vertex_list(self, vertex_list: List[Tuple[float, float, float]]) -> None:
+        self.vertices = array.array("d", itertools.chain.from_iterable(vertex_list))
+
+    @property
+    def normals_list(self) -> Tuple[Tuple[float, float, float], ...]:
+        return tuple(zip(self.normals[0::3], self.normals[1::3], self.normals[2::3]))
+
+    @normals_list.setter
+    def normals_list(self, normals_list: List[Tuple[float, float, float]]) -> None:
+        self.normals = array.array("d", itertools.chain.from_iterable(normals_list))
+
+    @property
+    def faces_list(self) -> Tuple[Tuple[int, ...], ...]:
+        indices = self.face_indices
+        offsets = self.face_offsets
+
+        return tuple(tuple(indices[offsets[i]:offsets[i + 1]]) for i in range(len(offsets) - 1))
+
+    @faces_list.setter
+    def faces_list(self, faces_list: List[Tuple[int, ...]]) -> None:
+        self.face_indices = array.array("I", itertools.chain.from_iterable(faces_list))
+        self.face_offsets = array.array("I", (0,))
+        self.face_offsets.extend(itertools.accumulate(len(face) for face in faces_list))
+
+    @property
+    def texcoords_list(self) -> Tuple[Tuple[int, float, float], ...]:
+        return tuple(zip(self.texcoord_indices, self.texcoords[0::2], self.texcoords[1::2]))
+
+    @texcoords_list.setter
+    def texcoords_list(self, texcoords_list: List[Tuple[int, float, float]]) -> None:
+        self.texcoord_indices = array.array("I", (texcoords[0] for texcoords in texcoords_list))
+        self.texcoords = array.array("d", itertools.chain.from_iterable(texcoords[1:] for texcoords in texcoords_list))
+
+    def transform_vertices(self, m: Matrix) -> None:
+        v = self.vertices
+        self.vertices = array.array("d", itertools.chain.from_iterable((m[0] * x + m[1] * y + m[2] * z + m[3], m[4] * x + m[5] * y + m[6] * z + m[7], m[8] * x + m[9] * y + m[10] * z + m[11]) for x, y, z in zip(v[0::3], v[1::3], v[2::3])))
+
+    def reverse_faces(self) -> None:
+        indices = self.face_indices
+        offsets = self.face_offsets
+        self.face_indices = array.array("I", itertools.chain.from_iterable(reversed(indices[offsets[i]:offsets[i + 1]]) for i in range(len(offsets) - 1)))
+
 
 class ImportOption:
     def __init__(self):
         self.use_transform_coords = True
         self.use_split_add_face2 = False
+        self.use_numpy = numpy is not None
+        self.use_compact_mesh = True
+        self.encoding = ""
+        self.use_cache = True
+        self.cache_dir = str(pathlib.Path.home().joinpath("io_scene_csv_cache"))
+        self.cache_max_size = 256 * 1024 * 1024
+        self.bulk_mesh_threshold = 1000
+        self.use_merge_meshes = False
 
 
 class ExportOption:
@@ -55,19 +253,129 @@ class ExportOption:
         self.global_mesh_scale = 1.0
         self.use_normals = True
         self.use_copy_texture_separate_directory = True
+        self.use_hardlink_textures = False
+        self.texcoords_tolerance = 0.0
+        self.use_weld_vertices = False
+        self.weld_epsilon = 0.00001
+        self.coordinate_precision = 6
+        self.normal_precision = 6
+        self.texcoords_precision = 6
+        self.use_pair_add_face2 = False
+        self.max_vertices = 65535
+
+
+class TexturePathResolver:
+    # Resolves texture paths relative to the model the way OpenBVE does on Windows:
+    # backslashes are separators and file names are matched case-insensitively.
+    # Directory listings and resolved paths are cached, and each unresolvable path is reported once.
+    def __init__(self) -> None:
+        self.listings = {}  # type: Dict[str, Tuple[Set[str], Dict[str, str]]]
+        self.resolved = {}  # type: Dict[str, str]
 
+    def list_dir(self, dir_path: str) -> Tuple[Set[str], Dict[str, str]]:
+        if dir_path not in self.listings:
+            try:
+                names = os.listdir(dir_path)
+            except OSError:
+                self.listings[dir_path] = None
+            else:
+                folded = {}  # type: Dict[str, str]
 
-class CsvObject:
-    def is_potential_path(self, line: str) -> bool:
-        images = [".bmp", ".gi", ".jpg", ".jpeg", ".png"]
+                for name in sorted(names):
+                    folded.setdefault(name.lower(), name)
 
-        for image in images:
-            try:
-                i = line.index(image)
-            except ValueError:
-                i = -1
+                self.listings[dir_path] = (set(names), folded)
+
+        return self.listings[dir_path]
+
+    def find(self, path: str) -> str:
+        if os.path.exists(path):
+            return os.path.realpath(path)
+
+        drive, rest = os.path.splitdrive(path)
+        current = drive + os.sep
+
+        for part in rest.split(os.sep):
+            if part == "":
+                continue
+
+            listing = self.list_dir(current)
+
+            if listing is None:
+                return ""
+
+            if part not in listing[0]:
+                part = listing[1].get(part.lower())
 
-            if i >= 0:
+                if part is None:
+                    return ""
+
+            current = os.path.join(current, part)
+
+        return os.path.realpath(current)
+
+    def resolve(self, base_dir: str, file_name: str) -> str:
+        # Returns the absolute path of the texture, or "" when it does not exist.
+        # Different spellings of the same file share one lookup and one error report.
+        path = os.path.normpath(os.path.join(base_dir, file_name.replace("\\", os.sep)))
+        key = os.path.normcase(path)
+
+        if key not in self.resolved:
+            self.resolved[key] = self.find(path)
+
+            if self.resolved[key] == "":
+                logger.error("Texture file not found: " + path)
+
+        return self.resolved[key]
+
+
+class CsvObject:
+    def __init__(self) -> None:
+        self.option = ImportOption()
+        self.file_path = ""
+        self.meshes_list = []  # type: List[CsvMesh]
+        self.mesh = None  # type: CsvMesh
+        self.mesh_matrix = IDENTITY_MATRIX
+        self.mesh_flip_faces = False
+        self.all_transforms = []  # type: List[Tuple[Matrix, bool]]
+        self.finished_meshes = []  # type: List[Tuple[CsvMesh, Matrix, bool, int]]
+        self.texture_resolver = TexturePathResolver()
+
+        # Command handlers keyed by the lowercase command name
+        self.commands = {
+            "createmeshbuilder": self.parse_create_mesh_builder,
+            "addvertex": self.parse_add_vertex,
+            "addface": self.parse_add_face,
+            "addface2": self.parse_add_face2,
+            "cube": self.parse_cube,
+            "cylinder": self.parse_cylinder,
+            "translate": self.parse_translate,
+            "translateall": self.parse_translate_all,
+            "scale": self.parse_scale,
+            "scaleall": self.parse_scale_all,
+            "rotate": self.parse_rotate,
+            "rotateall": self.parse_rotate_all,
+            "shear": self.parse_shear,
+            "shearall": self.parse_shear_all,
+            "mirror": self.parse_mirror,
+            "mirrorall": self.parse_mirror_all,
+            "setcolor": self.parse_set_color,
+            "setemissivecolor": self.parse_set_emissive_color,
+            "setdecaltransparentcolor": self.parse_set_decal_transparent_color,
+            "setblendmode": self.parse_set_blend_mode,
+            "setblendingmode": self.parse_set_blend_mode,
+            "loadtexture": self.parse_load_texture,
+            "settexturecoordinates": self.parse_set_texture_coordinates
+        }  # type: Dict[str, Callable[[int, str, List[str]], None]]
+
+    def register_command(self, command: str, handler: Callable[[int, str, List[str]], None]) -> None:
+        # The handler is called with the line number, the command as written and its arguments.
+        # The mesh being built is available as self.mesh.
+        self.commands[command.lower()] = handler
+
+    def is_potential_path(self, line: str) -> bool:
+        for image in IMAGE_EXTENSIONS:
+            if image in line:
                 return True
 
         return False
@@ -138,55 +446,120 @@ class CsvObject:
 
             mesh.faces_list.append(tuple(face))
 
-    def apply_translation(self, mesh: CsvMesh, x: float, y: float, z: float) -> None:
-        for i in range(len(mesh.vertex_list)):
-            mesh.vertex_list[i] = (mesh.vertex_list[i][0] + x, mesh.vertex_list[i][1] + y, mesh.vertex_list[i][2] + z)
-
-    def apply_scale(self, mesh: CsvMesh, x: float, y: float, z: float) -> None:
-        for i in range(len(mesh.vertex_list)):
-            mesh.vertex_list[i] = (mesh.vertex_list[i][0] * x, mesh.vertex_list[i][1] * y, mesh.vertex_list[i][2] * z)
+    def translation_matrix(self, x: float, y: float, z: float) -> Matrix:
+        return (1.0, 0.0, 0.0, x,
+                0.0, 1.0, 0.0, y,
+                0.0, 0.0, 1.0, z)
 
-        if x * y * z < 0.0:
-            for i in range(len(mesh.faces_list)):
-                mesh.faces_list[i] = tuple(reversed(mesh.faces_list[i]))
+    def scale_matrix(self, x: float, y: float, z: float) -> Matrix:
+        return (x, 0.0, 0.0, 0.0,
+                0.0, y, 0.0, 0.0,
+                0.0, 0.0, z, 0.0)
 
-    def apply_rotation(self, mesh: CsvMesh, r: Tuple[float, float, float], angle: float) -> None:
+    def rotation_matrix(self, r: Tuple[float, float, float], angle: float) -> Matrix:
         cosine_of_angle = math.cos(angle)
         sine_of_angle = math.sin(angle)
         cosine_complement = 1.0 - cosine_of_angle
 
-        for i in range(len(mesh.vertex_list)):
-            x = (cosine_of_angle + cosine_complement * r[0] * r[0]) * mesh.vertex_list[i][0] + (cosine_complement * r[0] * r[1] - sine_of_angle * r[2]) * mesh.vertex_list[i][1] + (cosine_complement * r[0] * r[2] + sine_of_angle * r[1]) * mesh.vertex_list[i][2]
-            y = (cosine_of_angle + cosine_complement * r[1] * r[1]) * mesh.vertex_list[i][1] + (cosine_complement * r[0] * r[1] + sine_of_angle * r[2]) * mesh.vertex_list[i][0] + (cosine_complement * r[1] * r[2] - sine_of_angle * r[0]) * mesh.vertex_list[i][2]
-            z = (cosine_of_angle + cosine_complement * r[2] * r[2]) * mesh.vertex_list[i][2] + (cosine_complement * r[0] * r[2] - sine_of_angle * r[1]) * mesh.vertex_list[i][0] + (cosine_complement * r[1] * r[2] + sine_of_angle * r[0]) * mesh.vertex_list[i][1]
-            mesh.vertex_list[i] = (x, y, z)
+        return (cosine_of_angle + cosine_complement * r[0] * r[0], cosine_complement * r[0] * r[1] - sine_of_angle * r[2], cosine_complement * r[0] * r[2] + sine_of_angle * r[1], 0.0,
+                cosine_complement * r[0] * r[1] + sine_of_angle * r[2], cosine_of_angle + cosine_complement * r[1] * r[1], cosine_complement * r[1] * r[2] - sine_of_angle * r[0], 0.0,
+                cosine_complement * r[0] * r[2] - sine_of_angle * r[1], cosine_complement * r[1] * r[2] + sine_of_angle * r[0], cosine_of_angle + cosine_complement * r[2] * r[2], 0.0)
 
-    def apply_shear(self, mesh: CsvMesh, d: Tuple[float, float, float], s: Tuple[float, float, float], r: float) -> None:
-        for i in range(len(mesh.vertex_list)):
-            n = r * (d[0] * mesh.vertex_list[i][0] + d[1] * mesh.vertex_list[i][1] + d[2] * mesh.vertex_list[i][2])
-            mesh.vertex_list[i] = (mesh.vertex_list[i][0] + s[0] * n, mesh.vertex_list[i][1] + s[1] * n, mesh.vertex_list[i][2] + s[2] * n)
+    def shear_matrix(self, d: Tuple[float, float, float], s: Tuple[float, float, float], r: float) -> Matrix:
+        return (1.0 + r * s[0] * d[0], r * s[0] * d[1], r * s[0] * d[2], 0.0,
+                r * s[1] * d[0], 1.0 + r * s[1] * d[1], r * s[1] * d[2], 0.0,
+                r * s[2] * d[0], r * s[2] * d[1], 1.0 + r * s[2] * d[2], 0.0)
+
+    def mirror_matrix(self, vx: bool, vy: bool, vz: bool) -> Matrix:
+        return self.scale_matrix(-1.0 if vx else 1.0, -1.0 if vy else 1.0, -1.0 if vz else 1.0)
 
-    def apply_mirror(self, mesh: CsvMesh, vx: bool, vy: bool, vz: bool):
-        for i in range(len(mesh.vertex_list)):
-            x = mesh.vertex_list[i][0] * -1.0 if vx else mesh.vertex_list[i][0]
-            y = mesh.vertex_list[i][1] * -1.0 if vx else mesh.vertex_list[i][1]
-            z = mesh.vertex_list[i][2] * -1.0 if vx else mesh.vertex_list[i][2]
-            mesh.vertex_list[i] = (x, y, z)
+    def multiply_matrix(self, a: Matrix, b: Matrix) -> Matrix:
+        # Returns the transform that applies b first and then a.
+        return (a[0] * b[0] + a[1] * b[4] + a[2] * b[8], a[0] * b[1] + a[1] * b[5] + a[2] * b[9], a[0] * b[2] + a[1] * b[6] + a[2] * b[10], a[0] * b[3] + a[1] * b[7] + a[2] * b[11] + a[3],
+                a[4] * b[0] + a[5] * b[4] + a[6] * b[8], a[4] * b[1] + a[5] * b[5] + a[6] * b[9], a[4] * b[2] + a[5] * b[6] + a[6] * b[10], a[4] * b[3] + a[5] * b[7] + a[6] * b[11] + a[7],
+                a[8] * b[0] + a[9] * b[4] + a[10] * b[8], a[8] * b[1] + a[9] * b[5] + a[10] * b[9], a[8] * b[2] + a[9] * b[6] + a[10] * b[10], a[8] * b[3] + a[9] * b[7] + a[10] * b[11] + a[11])
 
-        num_flips = 0
+    def determinant(self, m: Matrix) -> float:
+        return m[0] * (m[5] * m[10] - m[6] * m[9]) - m[1] * (m[4] * m[10] - m[6] * m[8]) + m[2] * (m[4] * m[9] - m[5] * m[8])
 
-        if vx:
-            num_flips += 1
+    def apply_matrix(self, mesh: CsvMesh, m: Matrix, flip_faces: bool) -> None:
+        if isinstance(mesh, (NumpyCsvMesh, ArrayCsvMesh)):
+            if m != IDENTITY_MATRIX:
+                mesh.transform_vertices(m)
 
-        if vy:
-            num_flips += 1
+            if flip_faces:
+                mesh.reverse_faces()
 
-        if vz:
-            num_flips += 1
+            return
 
-        if num_flips % 2 != 0:
-            for i in range(len(mesh.faces_list)):
-                mesh.faces_list[i] = tuple(reversed(mesh.faces_list[i]))
+        if m != IDENTITY_MATRIX:
+            mesh.vertex_list = [(m[0] * x + m[1] * y + m[2] * z + m[3], m[4] * x + m[5] * y + m[6] * z + m[7], m[8] * x + m[9] * y + m[10] * z + m[11]) for x, y, z in mesh.vertex_list]
+
+        if flip_faces:
+            mesh.faces_list = [tuple(reversed(face)) for face in mesh.faces_list]
+
+    def apply_translation(self, mesh: CsvMesh, x: float, y: float, z: float) -> None:
+        self.apply_matrix(mesh, self.translation_matrix(x, y, z), False)
+
+    def apply_scale(self, mesh: CsvMesh, x: float, y: float, z: float) -> None:
+        m = self.scale_matrix(x, y, z)
+        self.apply_matrix(mesh, m, self.determinant(m) < 0.0)
+
+    def apply_rotation(self, mesh: CsvMesh, r: Tuple[float, float, float], angle: float) -> None:
+        self.apply_matrix(mesh, self.rotation_matrix(r, angle), False)
+
+    def apply_shear(self, mesh: CsvMesh, d: Tuple[float, float, float], s: Tuple[float, float, float], r: float) -> None:
+        self.apply_matrix(mesh, self.shear_matrix(d, s, r), False)
+
+    def apply_mirror(self, mesh: CsvMesh, vx: bool, vy: bool, vz: bool) -> None:
+        m = self.mirror_matrix(vx, vy, vz)
+        self.apply_matrix(mesh, m, self.determinant(m) < 0.0)
+
+    def transform(self, m: Matrix, flip_faces: bool, apply_all: bool) -> None:
+        # Transforms are not applied to the vertices right away. They are accumulated for the current mesh,
+        # and the *All variants are also queued for the meshes that are already finished.
+        self.mesh_matrix = self.multiply_matrix(m, self.mesh_matrix)
+        self.mesh_flip_faces ^= flip_faces
+
+        if apply_all:
+            self.all_transforms.append((m, flip_faces))
+
+    def flush_transform(self) -> None:
+        # Vertices and faces added from now on must not be affected by the accumulated transform.
+        if self.mesh_matrix is not IDENTITY_MATRIX or self.mesh_flip_faces:
+            self.apply_matrix(self.mesh, self.mesh_matrix, self.mesh_flip_faces)
+            self.mesh_matrix = IDENTITY_MATRIX
+            self.mesh_flip_faces = False
+
+    def finalize_mesh(self) -> None:
+        if self.option.use_numpy and numpy is not None:
+            self.mesh = NumpyCsvMesh.from_mesh(self.mesh)
+        elif self.option.use_compact_mesh:
+            self.mesh = ArrayCsvMesh.from_mesh(self.mesh)
+
+        self.meshes_list.append(self.mesh)
+        self.finished_meshes.append((self.mesh, self.mesh_matrix, self.mesh_flip_faces, len(self.all_transforms)))
+        self.mesh = None
+        self.mesh_matrix = IDENTITY_MATRIX
+        self.mesh_flip_faces = False
+
+    def apply_finished_transforms(self) -> None:
+        # Walk the finished meshes backwards while composing the *All transforms issued after each of them,
+        # so that every mesh is transformed exactly once.
+        all_matrix = IDENTITY_MATRIX
+        all_flip_faces = False
+        i = len(self.all_transforms)
+
+        for mesh, mesh_matrix, mesh_flip_faces, num_transforms in reversed(self.finished_meshes):
+            while i > num_transforms:
+                i -= 1
+                all_matrix = self.multiply_matrix(all_matrix, self.all_transforms[i][0])
+                all_flip_faces ^= self.all_transforms[i][1]
+
+            self.apply_matrix(mesh, self.multiply_matrix(all_matrix, mesh_matrix), mesh_flip_faces ^ all_flip_faces)
+
+        self.finished_meshes = []
+        self.all_transforms = []
 
     def normalize(self, v: Tuple[float, float, float]) -> Tuple[float, float, float]:
         norm = v[0] * v[0] + v[1] * v[1] + v[2] * v[2]
@@ -197,805 +570,911 @@ class CsvObject:
         factor = 1.0 / math.sqrt(norm)
         return (v[0] * factor, v[1] * factor, v[2] * factor)
 
-    def load_csv(self, option: ImportOption, file_path: str) -> List[CsvMesh]:
-        meshes_list = []  # type: List[CsvMesh]
+    def encoding_sample(self, binary: bytes) -> bytes:
+        # The leading part of the file cut at a line break, followed by the non-ASCII lines of the rest.
+        if len(binary) <= ENCODING_SAMPLE_SIZE:
+            return binary
 
-        logger.info("Loading file: " + file_path)
+        head_end = binary.rfind(b"\n", 0, ENCODING_SAMPLE_SIZE) + 1
+
+        if head_end == 0:
+            head_end = ENCODING_SAMPLE_SIZE
+
+        sample = [binary[:head_end]]
+        sample_size = 0
+        match = NON_ASCII_BYTE.search(binary, head_end)
+
+        while match is not None and sample_size < ENCODING_SAMPLE_SIZE:
+            line_start = binary.rfind(b"\n", 0, match.start()) + 1
+            line_end = binary.find(b"\n", match.end())
+            line_end = len(binary) if line_end < 0 else line_end + 1
+            sample.append(binary[line_start:line_end])
+            sample_size += line_end - line_start
+            match = NON_ASCII_BYTE.search(binary, line_end)
+
+        return b"".join(sample)
+
+    def decode(self, binary: bytes, encoding: str) -> str:
+        # Decoding order: the forced encoding, a byte order mark, strict UTF-8 and finally chardet on a sample.
+        if encoding != "":
+            logger.info("Encoding: " + encoding + " (forced)")
+
+            # A byte order mark of the forced encoding is not part of the text.
+            for bom, bom_encoding in BYTE_ORDER_MARKS:
+                if binary.startswith(bom) and codecs.lookup(encoding).name == codecs.lookup(bom_encoding).name:
+                    binary = binary[len(bom):]
+                    break
+
+            return binary.decode(encoding)
+
+        for bom, bom_encoding in BYTE_ORDER_MARKS:
+            if binary.startswith(bom):
+                logger.info("Encoding: " + bom_encoding + " (byte order mark)")
+                return binary[len(bom):].decode(bom_encoding)
 
-        # Open CSV file
         try:
-            with open(file_path, "rb") as f:
-                binary = f.read()
+            csv_text = binary.decode("utf-8")
+            logger.info("Encoding: utf-8")
+            return csv_text
+        except UnicodeDecodeError:
+            pass
 
-            csv_text = binary.decode(chardet.detect(binary)["encoding"]).splitlines()
-        except Exception as ex:
-            logger.critical(ex)
-            return meshes_list
+        # Importing chardet is slow, so it is only done when it is needed.
+        from .chardet import chardet
+
+        encoding = chardet.detect(self.encoding_sample(binary))["encoding"]
+        logger.info("Encoding: " + str(encoding) + " (detected)")
+
+        return binary.decode(encoding)
 
-        # Parse CSV file
-        # Delete comments
+    def tokenize(self, csv_text: str) -> Iterator[Tuple[int, str, List[str]]]:
         comment_started = False
+        line_no = 0
+        start = 0
+        text_length = len(csv_text)
+
+        while start < text_length:
+            # Cut out the next line without materialising the whole list of lines
+            match = LINE_BREAK.search(csv_text, start)
+
+            if match is None:
+                line = csv_text[start:]
+                start = text_length
+            else:
+                line = csv_text[start:match.start()]
+                start = match.end()
+
+            line_no += 1
+
+            # Skip the rest of a star backslash comment
+            if comment_started:
+                m = line.find("*/")
+
+                if m < 0:
+                    continue
+
+                comment_started = False
+                line = line[m + 2:]
 
-        for i in range(len(csv_text)):
             # Strip OpenBVE original standard comments
-            try:
-                j = csv_text[i].index(";")
-            except ValueError:
-                j = -1
+            j = line.find(";")
 
             if j >= 0:
-                csv_text[i] = csv_text[i][:j]
+                line = line[:j]
 
             # Strip double backslash comments
-            try:
-                k = csv_text[i].index("//")
-            except ValueError:
-                k = -1
+            is_potential_path = False
+            k = line.find("//")
 
             if k >= 0:
-                if self.is_potential_path(csv_text[i]):
+                if self.is_potential_path(line):
                     # HACK: Handles malformed potential paths
-                    continue
-
-                csv_text[i] = csv_text[i][:k]
+                    is_potential_path = True
+                else:
+                    line = line[:k]
 
             # Strip star backslash comments
-            if not comment_started:
-                try:
-                    m = csv_text[i].index("/*")
-                except ValueError:
-                    m = -1
+            m = -1 if is_potential_path else line.find("/*")
+
+            while m >= 0:
+                n = line.find("*/", m + 2)
 
-                if m >= 0:
+                if n < 0:
                     comment_started = True
-                    part1 = csv_text[i][:1]
-                    part2 = ""
+                    line = line[:m]
+                    break
 
-                    try:
-                        n = csv_text[i].index("*/")
-                    except ValueError:
-                        n = -1
+                line = line[:m] + line[n + 2:]
+                m = line.find("/*", m)
 
-                    if n >= 0:
-                        part2 = csv_text[i][n + 2:]
+            # Collect arguments
+            arguments = line.split(",")
+            command = arguments[0].strip()
 
-                    csv_text[i] = part1 + part2
-            else:
-                try:
-                    m = csv_text[i].index("*/")
-                except ValueError:
-                    m = -1
+            if command == "":
+                continue
 
-                if m >= 0:
-                    comment_started = True
+            yield line_no, command, [argument.strip() for argument in arguments[1:]]
 
-                    if m + 2 != len(csv_text[i]):
-                        csv_text[i] = csv_text[i][m + 2:]
-                    else:
-                        csv_text[i] = ""
-                else:
-                    csv_text[i] = ""
+    def parse_create_mesh_builder(self, line_no: int, command: str, arguments: List[str]) -> None:
+        if len(arguments) > 0:
+            logger.warning("0 arguments are expected in " + command + " at line " + str(line_no))
 
-        # Parse lines
-        mesh = None
+        if self.mesh is not None:
+            self.finalize_mesh()
 
-        for i in range(len(csv_text)):
-            # Collect arguments
-            arguments = csv_text[i].split(",")
+        self.mesh = CsvMesh()
 
-            for j in range(len(arguments)):
-                arguments[j] = arguments[j].strip()
+    def parse_add_vertex(self, line_no: int, command: str, arguments: List[str]) -> None:
+        if len(arguments) > 6:
+            logger.warning("At most 6 arguments are expected in " + command + " at line " + str(line_no))
 
-            command = arguments.pop(0)
+        try:
+            vx = float(arguments[0])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument vX in " + command + " at line " + str(line_no))
 
-            if command == "":
-                continue
+            vx = 0.0
 
-            # Parse terms
-            if command.lower() == "CreateMeshBuilder".lower():
-                if len(arguments) > 0:
-                    logger.warning("0 arguments are expected in " + command + " at line " + str(i + 1))
+        try:
+            vy = float(arguments[1])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument vY in " + command + " at line " + str(line_no))
 
-                if mesh is not None:
-                    meshes_list.append(mesh)
+            vy = 0.0
 
-                mesh = CsvMesh()
+        try:
+            vz = float(arguments[2])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument vZ in " + command + " at line " + str(line_no))
 
-            elif mesh is None:
-                logger.error(command + " before the first CreateMeshBuilder are ignored at line " + str(i + 1))
+            vz = 0.0
 
-            elif command.lower() == "AddVertex".lower():
-                if len(arguments) > 6:
-                    logger.warning("At most 6 arguments are expected in " + command + " at line " + str(i + 1))
+        if len(arguments) >= 4:
+            logger.info("This add-on ignores nX, nY and nZ in " + command + " at line " + str(line_no))
 
-                try:
-                    vx = float(arguments[0])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument vX in " + command + " at line " + str(i + 1))
+        self.flush_transform()
+        self.mesh.vertex_list.append((vx, vy, vz))
 
-                    vx = 0.0
+    def parse_add_face(self, line_no: int, command: str, arguments: List[str], is_add_face2: bool = False) -> None:
+        if len(arguments) < 3:
+            logger.error("At least 3 arguments are required in " + command + " at line " + str(line_no))
+        else:
+            q = True
+            a = []
 
+            for j in range(len(arguments)):
                 try:
-                    vy = float(arguments[1])
+                    a.append(int(arguments[j]))
                 except Exception as ex:
                     if type(ex) is not IndexError:
-                        logger.error("Invalid argument vY in " + command + " at line " + str(i + 1))
+                        logger.error("v" + str(j) + " is invalid in " + command + " at line " + str(line_no))
 
-                    vy = 0.0
+                    q = False
+                    break
 
-                try:
-                    vz = float(arguments[2])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument vZ in " + command + " at line " + str(i + 1))
+                if a[j] < 0 or a[j] >= len(self.mesh.vertex_list):
+                    logger.error("v" + str(j) + " references a non-existing vertex in " + command + " at line " + str(line_no))
+                    q = False
+                    break
 
-                    vz = 0.0
+                if a[j] > 65535:
+                    logger.error("v" + str(j) + " indexes a vertex above 65535 which is not currently supported in " + command + " at line " + str(line_no))
+                    q = False
+                    break
 
-                if len(arguments) >= 4:
-                    logger.info("This add-on ignores nX, nY and nZ in " + command + " at line " + str(i + 1))
+            if q:
+                self.flush_transform()
+                self.mesh.faces_list.append(tuple(a))
 
-                mesh.vertex_list.append((vx, vy, vz))
+                if is_add_face2:
+                    if self.option.use_split_add_face2:
+                        self.mesh.faces_list.append(tuple(reversed(a)))
+                    else:
+                        self.mesh.use_add_face2 = True
 
-            elif command.lower() == "AddFace".lower() or command.lower() == "AddFace2".lower():
-                if len(arguments) < 3:
-                    logger.error("At least 3 arguments are required in " + command + " at line " + str(i + 1))
-                else:
-                    q = True
-                    a = []
-
-                    for j in range(len(arguments)):
-                        try:
-                            a.append(int(arguments[j]))
-                        except Exception as ex:
-                            if type(ex) is not IndexError:
-                                logger.error("v" + str(j) + " is invalid in " + command + " at line " + str(i + 1))
-
-                            q = False
-                            break
-
-                        if a[j] < 0 or a[j] >= len(mesh.vertex_list):
-                            logger.error("v" + str(j) + " references a non-existing vertex in " + command + " at line " + str(i + 1))
-                            q = False
-                            break
-
-                        if a[j] > 65535:
-                            logger.error("v" + str(j) + " indexes a vertex above 65535 which is not currently supported in " + command + " at line " + str(i + 1))
-                            q = False
-                            break
-
-                    if q:
-                        mesh.faces_list.append(tuple(a))
-
-                        if command.lower() == "AddFace2".lower():
-                            if option.use_split_add_face2:
-                                mesh.faces_list.append(tuple(reversed(a)))
-                            else:
-                                mesh.use_add_face2 = True
-
-            elif command.lower() == "Cube".lower():
-                if len(arguments) > 3:
-                    logger.warning("At most 3 arguments are expected in " + command + " at line " + str(i + 1))
+    def parse_add_face2(self, line_no: int, command: str, arguments: List[str]) -> None:
+        self.parse_add_face(line_no, command, arguments, True)
 
-                try:
-                    x = float(arguments[0])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument HalfWidth in " + command + " at line " + str(i + 1))
+    def parse_cube(self, line_no: int, command: str, arguments: List[str]) -> None:
+        if len(arguments) > 3:
+            logger.warning("At most 3 arguments are expected in " + command + " at line " + str(line_no))
 
-                    x = 1.0
+        try:
+            x = float(arguments[0])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument HalfWidth in " + command + " at line " + str(line_no))
 
-                try:
-                    y = float(arguments[1])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument HalfHeight in " + command + " at line " + str(i + 1))
+            x = 1.0
 
-                    y = 1.0
+        try:
+            y = float(arguments[1])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument HalfHeight in " + command + " at line " + str(line_no))
 
-                try:
-                    z = float(arguments[2])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument HalfDepth in " + command + " at line " + str(i + 1))
+            y = 1.0
 
-                    z = 1.0
+        try:
+            z = float(arguments[2])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument HalfDepth in " + command + " at line " + str(line_no))
 
-                self.create_cube(mesh, x, y, z)
+            z = 1.0
 
-            elif command.lower() == "Cylinder".lower():
-                if len(arguments) > 4:
-                    logger.warning("At most 4 arguments are expected in " + command + " at line " + str(i + 1))
+        self.flush_transform()
+        self.create_cube(self.mesh, x, y, z)
 
-                try:
-                    n = int(arguments[0])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument n in " + command + " at line " + str(i + 1))
+    def parse_cylinder(self, line_no: int, command: str, arguments: List[str]) -> None:
+        if len(arguments) > 4:
+            logger.warning("At most 4 arguments are expected in " + command + " at line " + str(line_no))
 
-                    n = 8
+        try:
+            n = int(arguments[0])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument n in " + command + " at line " + str(line_no))
 
-                if n < 2:
-                    logger.error("n is expected to be at least 2 in " + command + " at line " + str(i + 1))
-                    n = 8
+            n = 8
 
-                try:
-                    r1 = float(arguments[1])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument UpperRadius in " + command + " at line " + str(i + 1))
+        if n < 2:
+            logger.error("n is expected to be at least 2 in " + command + " at line " + str(line_no))
+            n = 8
 
-                    r1 = 1.0
+        try:
+            r1 = float(arguments[1])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument UpperRadius in " + command + " at line " + str(line_no))
 
-                try:
-                    r2 = float(arguments[2])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument LowerRadius in " + command + " at line " + str(i + 1))
+            r1 = 1.0
 
-                    r2 = 1.0
+        try:
+            r2 = float(arguments[2])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument LowerRadius in " + command + " at line " + str(line_no))
 
-                try:
-                    h = float(arguments[3])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument Height in " + command + " at line " + str(i + 1))
+            r2 = 1.0
 
-                    h = 1.0
+        try:
+            h = float(arguments[3])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument Height in " + command + " at line " + str(line_no))
 
-                self.create_cylinder(mesh, n, r1, r2, h)
+            h = 1.0
 
-            elif command.lower() == "Translate".lower() or command.lower() == "TranslateAll".lower():
-                if len(arguments) > 3:
-                    logger.warning("At most 3 arguments are expected in " + command + " at line " + str(i + 1))
+        self.flush_transform()
+        self.create_cylinder(self.mesh, n, r1, r2, h)
 
-                try:
-                    x = float(arguments[0])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument X in " + command + " at line " + str(i + 1))
+    def parse_translate(self, line_no: int, command: str, arguments: List[str], apply_all: bool = False) -> None:
+        if len(arguments) > 3:
+            logger.warning("At most 3 arguments are expected in " + command + " at line " + str(line_no))
 
-                    x = 0.0
+        try:
+            x = float(arguments[0])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument X in " + command + " at line " + str(line_no))
 
-                try:
-                    y = float(arguments[1])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument Y in " + command + " at line " + str(i + 1))
+            x = 0.0
 
-                    y = 0.0
+        try:
+            y = float(arguments[1])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument Y in " + command + " at line " + str(line_no))
 
-                try:
-                    z = float(arguments[2])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument Z in " + command + " at line " + str(i + 1))
+            y = 0.0
 
-                    z = 0.0
+        try:
+            z = float(arguments[2])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument Z in " + command + " at line " + str(line_no))
 
-                self.apply_translation(mesh, x, y, z)
+            z = 0.0
 
-                if command.lower() == "TranslateAll".lower():
-                    for other_mesh in meshes_list:
-                        self.apply_translation(other_mesh, x, y, z)
+        self.transform(self.translation_matrix(x, y, z), False, apply_all)
 
-            elif command.lower() == "Scale".lower() or command.lower() == "ScaleAll".lower():
-                if len(arguments) > 3:
-                    logger.warning("At most 3 arguments are expected in " + command + " at line " + str(i + 1))
+    def parse_translate_all(self, line_no: int, command: str, arguments: List[str]) -> None:
+        self.parse_translate(line_no, command, arguments, True)
 
-                try:
-                    x = float(arguments[0])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument X in " + command + " at line " + str(i + 1))
+    def parse_scale(self, line_no: int, command: str, arguments: List[str], apply_all: bool = False) -> None:
+        if len(arguments) > 3:
+            logger.warning("At most 3 arguments are expected in " + command + " at line " + str(line_no))
 
-                    x = 1.0
+        try:
+            x = float(arguments[0])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument X in " + command + " at line " + str(line_no))
 
-                if x == 0.0:
-                    logger.error("X is required to be different from zero in " + command + " at line " + str(i + 1))
-                    x = 1.0
+            x = 1.0
 
-                try:
-                    y = float(arguments[1])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument Y in " + command + " at line " + str(i + 1))
+        if x == 0.0:
+            logger.error("X is required to be different from zero in " + command + " at line " + str(line_no))
+            x = 1.0
 
-                    y = 1.0
+        try:
+            y = float(arguments[1])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument Y in " + command + " at line " + str(line_no))
 
-                if y == 0.0:
-                    logger.error("Y is required to be different from zero in " + command + " at line " + str(i + 1))
-                    y = 1.0
+            y = 1.0
 
-                try:
-                    z = float(arguments[2])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument Z in " + command + " at line " + str(i + 1))
+        if y == 0.0:
+            logger.error("Y is required to be different from zero in " + command + " at line " + str(line_no))
+            y = 1.0
 
-                    z = 1.0
+        try:
+            z = float(arguments[2])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument Z in " + command + " at line " + str(line_no))
 
-                if z == 0.0:
-                    logger.error("Z is required to be different from zero in " + command + " at line " + str(i + 1))
-                    z = 1.0
+            z = 1.0
 
-                self.apply_scale(mesh, x, y, z)
+        if z == 0.0:
+            logger.error("Z is required to be different from zero in " + command + " at line " + str(line_no))
+            z = 1.0
 
-                if command.lower() == "ScaleAll".lower():
-                    for other_mesh in meshes_list:
-                        self.apply_scale(other_mesh, x, y, z)
+        m = self.scale_matrix(x, y, z)
+        self.transform(m, self.determinant(m) < 0.0, apply_all)
 
-            elif command.lower() == "Rotate".lower() or command.lower() == "RotateAll".lower():
-                if len(arguments) > 4:
-                    logger.warning("At most 4 arguments are expected in " + command + " at line " + str(i + 1))
+    def parse_scale_all(self, line_no: int, command: str, arguments: List[str]) -> None:
+        self.parse_scale(line_no, command, arguments, True)
 
-                try:
-                    rx = float(arguments[0])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument X in " + command + " at line " + str(i + 1))
+    def parse_rotate(self, line_no: int, command: str, arguments: List[str], apply_all: bool = False) -> None:
+        if len(arguments) > 4:
+            logger.warning("At most 4 arguments are expected in " + command + " at line " + str(line_no))
 
-                    rx = 0.0
+        try:
+            rx = float(arguments[0])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument X in " + command + " at line " + str(line_no))
 
-                try:
-                    ry = float(arguments[1])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument Y in " + command + " at line " + str(i + 1))
+            rx = 0.0
 
-                    ry = 0.0
+        try:
+            ry = float(arguments[1])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument Y in " + command + " at line " + str(line_no))
 
-                try:
-                    rz = float(arguments[2])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument Z in " + command + " at line " + str(i + 1))
+            ry = 0.0
 
-                    rz = 0.0
+        try:
+            rz = float(arguments[2])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument Z in " + command + " at line " + str(line_no))
 
-                try:
-                    angle = float(arguments[3])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument Angle in " + command + " at line " + str(i + 1))
+            rz = 0.0
 
-                    angle = 0.0
+        try:
+            angle = float(arguments[3])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument Angle in " + command + " at line " + str(line_no))
 
-                t = rx * rx + ry * ry + rz * rz
+            angle = 0.0
 
-                if t == 0.0:
-                    rz = 1.0
-                    ry = rz = 0.0
-                    t = 1.0
+        t = rx * rx + ry * ry + rz * rz
 
-                if angle != 0.0:
-                    t = 1.0 / math.sqrt(t)
-                    rx *= t
-                    ry *= t
-                    rz *= t
-                    angle *= math.pi / 180.0
+        if t == 0.0:
+            rz = 1.0
+            ry = rz = 0.0
+            t = 1.0
 
-                    self.apply_rotation(mesh, (rx, ry, rz), angle)
+        if angle != 0.0:
+            t = 1.0 / math.sqrt(t)
+            rx *= t
+            ry *= t
+            rz *= t
+            angle *= math.pi / 180.0
 
-                    if command.lower() == "RotateAll".lower():
-                        for other_mesh in meshes_list:
-                            self.apply_rotation(other_mesh, (rx, ry, rz), angle)
+            self.transform(self.rotation_matrix((rx, ry, rz), angle), False, apply_all)
 
-            elif command.lower() == "Shear".lower() or command.lower() == "ShearAll".lower():
-                if len(arguments) > 7:
-                    logger.warning("At most 7 arguments are expected in " + command + " at line " + str(i + 1))
+    def parse_rotate_all(self, line_no: int, command: str, arguments: List[str]) -> None:
+        self.parse_rotate(line_no, command, arguments, True)
 
-                try:
-                    dx = float(arguments[0])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument dX in " + command + " at line " + str(i + 1))
+    def parse_shear(self, line_no: int, command: str, arguments: List[str], apply_all: bool = False) -> None:
+        if len(arguments) > 7:
+            logger.warning("At most 7 arguments are expected in " + command + " at line " + str(line_no))
 
-                    dx = 0.0
+        try:
+            dx = float(arguments[0])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument dX in " + command + " at line " + str(line_no))
 
-                try:
-                    dy = float(arguments[1])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument dY in " + command + " at line " + str(i + 1))
+            dx = 0.0
 
-                    dy = 0.0
+        try:
+            dy = float(arguments[1])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument dY in " + command + " at line " + str(line_no))
 
-                try:
-                    dz = float(arguments[2])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument dZ in " + command + " at line " + str(i + 1))
+            dy = 0.0
 
-                    dz = 0.0
+        try:
+            dz = float(arguments[2])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument dZ in " + command + " at line " + str(line_no))
 
-                try:
-                    sx = float(arguments[3])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument sX in " + command + " at line " + str(i + 1))
+            dz = 0.0
 
-                    sx = 0.0
+        try:
+            sx = float(arguments[3])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument sX in " + command + " at line " + str(line_no))
 
-                try:
-                    sy = float(arguments[4])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument sY in " + command + " at line " + str(i + 1))
+            sx = 0.0
 
-                    sy = 0.0
+        try:
+            sy = float(arguments[4])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument sY in " + command + " at line " + str(line_no))
 
-                try:
-                    sz = float(arguments[5])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument sZ in " + command + " at line " + str(i + 1))
+            sy = 0.0
 
-                    sz = 0.0
+        try:
+            sz = float(arguments[5])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument sZ in " + command + " at line " + str(line_no))
 
-                try:
-                    r = float(arguments[6])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument Ratio in " + command + " at line " + str(i + 1))
+            sz = 0.0
 
-                    r = 0.0
+        try:
+            r = float(arguments[6])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument Ratio in " + command + " at line " + str(line_no))
 
-                d = self.normalize((dx, dy, dz))
-                s = self.normalize((sx, sy, sz))
-                self.apply_shear(mesh, d, s, r)
+            r = 0.0
 
-                if command.lower() == "ShearAll".lower():
-                    for other_mesh in meshes_list:
-                        self.apply_shear(other_mesh, d, s, r)
+        d = self.normalize((dx, dy, dz))
+        s = self.normalize((sx, sy, sz))
+        self.transform(self.shear_matrix(d, s, r), False, apply_all)
 
-            elif command.lower() == "Mirror".lower() or command.lower() == "MirrorAll".lower():
-                if len(arguments) > 6:
-                    logger.warning("At most 6 arguments are expected in " + command + " at line " + str(i + 1))
+    def parse_shear_all(self, line_no: int, command: str, arguments: List[str]) -> None:
+        self.parse_shear(line_no, command, arguments, True)
 
-                try:
-                    vx = float(arguments[0])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument vX in " + command + " at line " + str(i + 1))
+    def parse_mirror(self, line_no: int, command: str, arguments: List[str], apply_all: bool = False) -> None:
+        if len(arguments) > 6:
+            logger.warning("At most 6 arguments are expected in " + command + " at line " + str(line_no))
 
-                    vx = 0.0
+        try:
+            vx = float(arguments[0])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument vX in " + command + " at line " + str(line_no))
 
-                try:
-                    vy = float(arguments[1])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument vY in " + command + " at line " + str(i + 1))
+            vx = 0.0
 
-                    vy = 0.0
+        try:
+            vy = float(arguments[1])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument vY in " + command + " at line " + str(line_no))
 
-                try:
-                    vz = float(arguments[2])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument vZ in " + command + " at line " + str(i + 1))
+            vy = 0.0
 
-                    vz = 0.0
+        try:
+            vz = float(arguments[2])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument vZ in " + command + " at line " + str(line_no))
 
-                if len(arguments) >= 4:
-                    logger.info("This add-on ignores nX, nY and nZ in " + command + " at line " + str(i + 1))
+            vz = 0.0
 
-                self.apply_mirror(mesh, vx != 0.0, vy != 0.0, vz != 0.0)
+        if len(arguments) >= 4:
+            logger.info("This add-on ignores nX, nY and nZ in " + command + " at line " + str(line_no))
 
-                if command.lower() == "MirrorAll".lower():
-                    for other_mesh in meshes_list:
-                        self.apply_mirror(other_mesh, vx != 0.0, vy != 0.0, vz != 0.0)
+        m = self.mirror_matrix(vx != 0.0, vy != 0.0, vz != 0.0)
+        self.transform(m, self.determinant(m) < 0.0, apply_all)
 
-            elif command.lower() == "SetColor".lower():
-                if len(arguments) > 4:
-                    logger.warning("At most 4 arguments are expected in " + command + " at line " + str(i + 1))
+    def parse_mirror_all(self, line_no: int, command: str, arguments: List[str]) -> None:
+        self.parse_mirror(line_no, command, arguments, True)
 
-                try:
-                    red = int(arguments[0])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument Red in " + command + " at line " + str(i + 1))
+    def parse_set_color(self, line_no: int, command: str, arguments: List[str]) -> None:
+        if len(arguments) > 4:
+            logger.warning("At most 4 arguments are expected in " + command + " at line " + str(line_no))
 
-                    red = 0
+        try:
+            red = int(arguments[0])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument Red in " + command + " at line " + str(line_no))
 
-                if red < 0 or red > 255:
-                    logger.error("Red is required to be within the range from 0 to 255 in " + command + " at line " + str(i + 1))
-                    red = 0 if red < 0 else 255
+            red = 0
 
-                try:
-                    green = int(arguments[1])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument Green in " + command + " at line " + str(i + 1))
+        if red < 0 or red > 255:
+            logger.error("Red is required to be within the range from 0 to 255 in " + command + " at line " + str(line_no))
+            red = 0 if red < 0 else 255
 
-                    green = 0
+        try:
+            green = int(arguments[1])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument Green in " + command + " at line " + str(line_no))
 
-                if green < 0 or green > 255:
-                    logger.error("Green is required to be within the range from 0 to 255 in " + command + " at line " + str(i + 1))
-                    green = 0 if green < 0 else 255
+            green = 0
 
-                try:
-                    blue = int(arguments[2])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument Blue in " + command + " at line " + str(i + 1))
+        if green < 0 or green > 255:
+            logger.error("Green is required to be within the range from 0 to 255 in " + command + " at line " + str(line_no))
+            green = 0 if green < 0 else 255
 
-                    blue = 0
+        try:
+            blue = int(arguments[2])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument Blue in " + command + " at line " + str(line_no))
 
-                if blue < 0 or blue > 255:
-                    logger.error("Blue is required to be within the range from 0 to 255 in " + command + " at line " + str(i + 1))
-                    blue = 0 if blue < 0 else 255
+            blue = 0
 
-                try:
-                    alpha = int(arguments[3])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument Alpha in " + command + " at line " + str(i + 1))
+        if blue < 0 or blue > 255:
+            logger.error("Blue is required to be within the range from 0 to 255 in " + command + " at line " + str(line_no))
+            blue = 0 if blue < 0 else 255
 
-                    alpha = 0
+        try:
+            alpha = int(arguments[3])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument Alpha in " + command + " at line " + str(line_no))
 
-                if alpha < 0 or alpha > 255:
-                    logger.error("Alpha is required to be within the range from 0 to 255 in " + command + " at line " + str(i + 1))
-                    alpha = 0 if alpha < 0 else 255
+            alpha = 0
 
-                mesh.diffuse_color = (red, green, blue, alpha)
+        if alpha < 0 or alpha > 255:
+            logger.error("Alpha is required to be within the range from 0 to 255 in " + command + " at line " + str(line_no))
+            alpha = 0 if alpha < 0 else 255
 
-            elif command.lower() == "SetEmissiveColor".lower():
-                if len(arguments) > 3:
-                    logger.warning("At most 3 arguments are expected in " + command + " at line " + str(i + 1))
+        self.mesh.diffuse_color = (red, green, blue, alpha)
 
-                try:
-                    red = int(arguments[0])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument Red in " + command + " at line " + str(i + 1))
+    def parse_set_emissive_color(self, line_no: int, command: str, arguments: List[str]) -> None:
+        if len(arguments) > 3:
+            logger.warning("At most 3 arguments are expected in " + command + " at line " + str(line_no))
 
-                    red = 0
+        try:
+            red = int(arguments[0])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument Red in " + command + " at line " + str(line_no))
 
-                if red < 0 or red > 255:
-                    logger.error("Red is required to be within the range from 0 to 255 in " + command + " at line " + str(i + 1))
-                    red = 0 if red < 0 else 255
+            red = 0
 
-                try:
-                    green = int(arguments[1])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument Green in " + command + " at line " + str(i + 1))
+        if red < 0 or red > 255:
+            logger.error("Red is required to be within the range from 0 to 255 in " + command + " at line " + str(line_no))
+            red = 0 if red < 0 else 255
 
-                    green = 0
+        try:
+            green = int(arguments[1])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument Green in " + command + " at line " + str(line_no))
 
-                if green < 0 or green > 255:
-                    logger.error("Green is required to be within the range from 0 to 255 in " + command + " at line " + str(i + 1))
-                    green = 0 if green < 0 else 255
+            green = 0
 
-                try:
-                    blue = int(arguments[2])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument Blue in " + command + " at line " + str(i + 1))
+        if green < 0 or green > 255:
+            logger.error("Green is required to be within the range from 0 to 255 in " + command + " at line " + str(line_no))
+            green = 0 if green < 0 else 255
 
-                    blue = 0
+        try:
+            blue = int(arguments[2])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument Blue in " + command + " at line " + str(line_no))
 
-                if blue < 0 or blue > 255:
-                    logger.error("Blue is required to be within the range from 0 to 255 in " + command + " at line " + str(i + 1))
-                    blue = 0 if blue < 0 else 255
+            blue = 0
 
-                mesh.use_emissive_color = True
-                mesh.emissive_color = (red, green, blue)
+        if blue < 0 or blue > 255:
+            logger.error("Blue is required to be within the range from 0 to 255 in " + command + " at line " + str(line_no))
+            blue = 0 if blue < 0 else 255
 
-            elif command.lower() == "SetDecalTransparentColor".lower():
-                if len(arguments) > 3:
-                    logger.warning("At most 3 arguments are expected in " + command + " at line " + str(i + 1))
+        self.mesh.use_emissive_color = True
+        self.mesh.emissive_color = (red, green, blue)
 
-                try:
-                    red = int(arguments[0])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument Red in " + command + " at line " + str(i + 1))
+    def parse_set_decal_transparent_color(self, line_no: int, command: str, arguments: List[str]) -> None:
+        if len(arguments) > 3:
+            logger.warning("At most 3 arguments are expected in " + command + " at line " + str(line_no))
 
-                    red = 0
+        try:
+            red = int(arguments[0])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument Red in " + command + " at line " + str(line_no))
 
-                if red < 0 or red > 255:
-                    logger.error("Red is required to be within the range from 0 to 255 in " + command + " at line " + str(i + 1))
-                    red = 0 if red < 0 else 255
+            red = 0
 
-                try:
-                    green = int(arguments[1])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument Green in " + command + " at line " + str(i + 1))
+        if red < 0 or red > 255:
+            logger.error("Red is required to be within the range from 0 to 255 in " + command + " at line " + str(line_no))
+            red = 0 if red < 0 else 255
 
-                    green = 0
+        try:
+            green = int(arguments[1])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument Green in " + command + " at line " + str(line_no))
 
-                if green < 0 or green > 255:
-                    logger.error("Green is required to be within the range from 0 to 255 in " + command + " at line " + str(i + 1))
-                    green = 0 if green < 0 else 255
+            green = 0
 
-                try:
-                    blue = int(arguments[2])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument Blue in " + command + " at line " + str(i + 1))
+        if green < 0 or green > 255:
+            logger.error("Green is required to be within the range from 0 to 255 in " + command + " at line " + str(line_no))
+            green = 0 if green < 0 else 255
 
-                    blue = 0
+        try:
+            blue = int(arguments[2])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument Blue in " + command + " at line " + str(line_no))
 
-                if blue < 0 or blue > 255:
-                    logger.error("Blue is required to be within the range from 0 to 255 in " + command + " at line " + str(i + 1))
-                    blue = 0 if blue < 0 else 255
+            blue = 0
 
-                mesh.use_transparent_color = True
-                mesh.transparent_color = (red, green, blue)
+        if blue < 0 or blue > 255:
+            logger.error("Blue is required to be within the range from 0 to 255 in " + command + " at line " + str(line_no))
+            blue = 0 if blue < 0 else 255
 
-            elif command.lower() == "SetBlendMode".lower() or command.lower() == "SetBlendingMode".lower():
-                if len(arguments) > 3:
-                    logger.warning("At most 3 arguments are expected in " + command + " at line " + str(i + 1))
+        self.mesh.use_transparent_color = True
+        self.mesh.transparent_color = (red, green, blue)
 
-                try:
-                    if arguments[0].lower() == "normal":
-                        mesh.blend_mode = "Normal"
-                    elif arguments[0].lower() == "additive" or arguments[0].lower() == "glow":
-                        mesh.blend_mode = "Additive"
-                    else:
-                        logger.error("The given BlendMode is not supported in " + command + " at line " + str(i + 1))
-                        mesh.blend_mode = "Normal"
-                except Exception:
-                    mesh.blend_mode = "Normal"
+    def parse_set_blend_mode(self, line_no: int, command: str, arguments: List[str]) -> None:
+        if len(arguments) > 3:
+            logger.warning("At most 3 arguments are expected in " + command + " at line " + str(line_no))
 
-                try:
-                    mesh.glow_half_distance = int(arguments[1])
-                except Exception:
-                    logger.error("Invalid argument GlowHalfDistance in " + command + " at line " + str(i + 1))
-                    mesh.glow_half_distance = 0
+        try:
+            if arguments[0].lower() == "normal":
+                self.mesh.blend_mode = "Normal"
+            elif arguments[0].lower() == "additive" or arguments[0].lower() == "glow":
+                self.mesh.blend_mode = "Additive"
+            else:
+                logger.error("The given BlendMode is not supported in " + command + " at line " + str(line_no))
+                self.mesh.blend_mode = "Normal"
+        except Exception:
+            self.mesh.blend_mode = "Normal"
 
-                try:
-                    if arguments[2].lower() == "DivideExponent2".lower():
-                        mesh.glow_attenuation_mode = "DivideExponent2"
-                    elif arguments[2].lower() == "DivideExponent4".lower():
-                        mesh.glow_attenuation_mode = "DivideExponent4"
-                    else:
-                        logger.error("The given GlowAttenuationMode is not supported in " + command + " at line " + str(i + 1))
-                        mesh.glow_attenuation_mode = "DivideExponent4"
-                except Exception:
-                    mesh.glow_attenuation_mode = "DivideExponent4"
+        try:
+            self.mesh.glow_half_distance = int(arguments[1])
+        except Exception:
+            logger.error("Invalid argument GlowHalfDistance in " + command + " at line " + str(line_no))
+            self.mesh.glow_half_distance = 0
 
-            elif command.lower() == "LoadTexture".lower():
-                if len(arguments) > 2:
-                    logger.warning("At most 2 arguments are expected in " + command + " at line " + str(i + 1))
+        try:
+            if arguments[2].lower() == "DivideExponent2".lower():
+                self.mesh.glow_attenuation_mode = "DivideExponent2"
+            elif arguments[2].lower() == "DivideExponent4".lower():
+                self.mesh.glow_attenuation_mode = "DivideExponent4"
+            else:
+                logger.error("The given GlowAttenuationMode is not supported in " + command + " at line " + str(line_no))
+                self.mesh.glow_attenuation_mode = "DivideExponent4"
+        except Exception:
+            self.mesh.glow_attenuation_mode = "DivideExponent4"
 
-                try:
-                    mesh.daytime_texture_file = str(pathlib.Path(file_path).joinpath("..", arguments[0]).resolve())
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument DaytimeTexture in " + command + " at line " + str(i + 1))
+    def parse_load_texture(self, line_no: int, command: str, arguments: List[str]) -> None:
+        if len(arguments) > 2:
+            logger.warning("At most 2 arguments are expected in " + command + " at line " + str(line_no))
 
-                    mesh.daytime_texture_file = ""
+        base_dir = os.path.dirname(os.path.abspath(self.file_path))
 
-                try:
-                    mesh.nighttime_texture_file = str(pathlib.Path(file_path).joinpath("..", arguments[1]).resolve())
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument NighttimeTexture in " + command + " at line " + str(i + 1))
+        try:
+            self.mesh.daytime_texture_file = self.texture_resolver.resolve(base_dir, arguments[0]) if arguments[0] != "" else ""
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument DaytimeTexture in " + command + " at line " + str(line_no))
 
-                    mesh.nighttime_texture_file = ""
+            self.mesh.daytime_texture_file = ""
 
-            elif command.lower() == "SetTextureCoordinates".lower():
-                if len(arguments) > 3:
-                    logger.warning("At most 3 arguments are expected in " + command + " at line " + str(i + 1))
+        try:
+            self.mesh.nighttime_texture_file = self.texture_resolver.resolve(base_dir, arguments[1]) if arguments[1] != "" else ""
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument NighttimeTexture in " + command + " at line " + str(line_no))
 
-                try:
-                    j = int(arguments[0])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument VertexIndex in " + command + " at line " + str(i + 1))
+            self.mesh.nighttime_texture_file = ""
 
-                    j = 0
+    def parse_set_texture_coordinates(self, line_no: int, command: str, arguments: List[str]) -> None:
+        if len(arguments) > 3:
+            logger.warning("At most 3 arguments are expected in " + command + " at line " + str(line_no))
 
-                try:
-                    x = float(arguments[1])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument X in " + command + " at line " + str(i + 1))
+        try:
+            j = int(arguments[0])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument VertexIndex in " + command + " at line " + str(line_no))
 
-                    x = 0.0
+            j = 0
 
-                try:
-                    y = float(arguments[2])
-                except Exception as ex:
-                    if type(ex) is not IndexError:
-                        logger.error("Invalid argument Y in " + command + " at line " + str(i + 1))
+        try:
+            x = float(arguments[1])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument X in " + command + " at line " + str(line_no))
 
-                    y = 0.0
+            x = 0.0
 
-                if j >= 0 and j < len(mesh.vertex_list):
-                    mesh.texcoords_list.append((j, x, y))
-                else:
-                    logger.error("VertexIndex references a non-existing vertex in " + command + " at line " + str(i + 1))
+        try:
+            y = float(arguments[2])
+        except Exception as ex:
+            if type(ex) is not IndexError:
+                logger.error("Invalid argument Y in " + command + " at line " + str(line_no))
 
-            else:
-                logger.error("The command " + command + " is not supported at line " + str(i + 1))
+            y = 0.0
+
+        if j >= 0 and j < len(self.mesh.vertex_list):
+            self.mesh.texcoords_list.append((j, x, y))
+        else:
+            logger.error("VertexIndex references a non-existing vertex in " + command + " at line " + str(line_no))
+
+    def load_csv(self, option: ImportOption, file_path: str) -> List[CsvMesh]:
+        logger.info("Loading file: " + file_path)
+
+        # Open CSV file
+        try:
+            with open(file_path, "rb") as f:
+                binary = f.read()
+        except Exception as ex:
+            logger.critical(ex)
+            return []
+
+        return self.parse_csv(option, file_path, binary)
+
+    def parse_csv(self, option: ImportOption, file_path: str, binary: bytes) -> List[CsvMesh]:
+        meshes_list = []  # type: List[CsvMesh]
+
+        try:
+            csv_text = self.decode(binary, option.encoding)
+        except Exception as ex:
+            logger.critical(ex)
+            return meshes_list
+
+        # Parse lines
+        self.option = option
+        self.file_path = file_path
+        self.meshes_list = meshes_list
+        self.mesh = None
+        self.mesh_matrix = IDENTITY_MATRIX
+        self.mesh_flip_faces = False
+        self.all_transforms = []
+        self.finished_meshes = []
+
+        for line_no, command, arguments in self.tokenize(csv_text):
+            key = command.lower()
+
+            if self.mesh is None and key != "createmeshbuilder":
+                logger.error(command + " before the first CreateMeshBuilder are ignored at line " + str(line_no))
+                continue
+
+            handler = self.commands.get(key)
+
+            if handler is None:
+                logger.error("The command " + command + " is not supported at line " + str(line_no))
+                continue
+
+            handler(line_no, command, arguments)
 
         # Finalize
-        if mesh is not None:
-            meshes_list.append(mesh)
+        if self.mesh is not None:
+            self.finalize_mesh()
+
+        self.apply_finished_transforms()
 
         return meshes_list
 
-    def export_csv(self, option: ExportOption, meshes_list: List[CsvMesh], file_path: str) -> None:
-        if len(meshes_list) == 0:
-            logger.error("Select one or more objects to export.")
-            return
+    def compact_floats(self, csv_text: str) -> str:
+        # Trims the trailing zeros of fixed point fields and turns "-0" into "0".
+        return NEGATIVE_ZERO.sub("0", TRAILING_POINT.sub("", TRAILING_ZEROS.sub(lambda match: match.group(1), csv_text)))
 
+    def format_mesh(self, option: ExportOption, mesh: CsvMesh, model_dir: pathlib.Path) -> str:
         csv_text = []  # type: List[str]
 
-        # Header
-        csv_text.append(";---------------------------------------------------------------------------\n")
-        csv_text.append("; This file was exported from Blender by blenderCSV.\n")
-        csv_text.append("; https://github.com/maisvendoo/blenderCSV\n")
-        csv_text.append("; The copyright of this file belongs to the creator of the original content.\n")
-        csv_text.append(";---------------------------------------------------------------------------\n")
-
-        # Export model
-        for mesh in meshes_list:
-            # Apply global scale
-            self.apply_scale(mesh, option.global_mesh_scale, option.global_mesh_scale, option.global_mesh_scale)
-
-            # New mesh
-            csv_text.append("\n; " + mesh.name + "\n")
-            csv_text.append("CreateMeshBuilder\n")
-
-            # Vertices
-            for vertex, normal in zip(mesh.vertex_list, mesh.normals_list):
-                vertex_text = str(vertex[0]) + ", " + str(vertex[1]) + ", " + str(vertex[2])
-                normal_text = str(normal[0]) + ", " + str(normal[1]) + ", " + str(normal[2])
-
-                if option.use_normals:
-                    csv_text.append("AddVertex, " + vertex_text + ", " + normal_text + "\n")
-                else:
-                    csv_text.append("AddVertex, " + vertex_text + "\n")
+        coordinate_format = "%." + str(option.coordinate_precision) + "f"
+        normal_format = "%." + str(option.normal_precision) + "f"
+        texcoords_format = "%." + str(option.texcoords_precision) + "f"
 
-            # Faces
-            for face in mesh.faces_list:
-                face_text = ""
+        # New mesh
+        csv_text.append("\n; " + mesh.name + "\n")
+        csv_text.append("CreateMeshBuilder\n")
 
-                for vertex_index in face:
-                    face_text += ", " + str(vertex_index)
+        # Vertices
+        # Every line of a block is formatted by a single % operation on a repeated template.
+        vertices = list(zip(mesh.vertex_list, mesh.normals_list))
 
-                if mesh.use_add_face2:
-                    csv_text.append("AddFace2" + face_text + "\n")
-                else:
-                    csv_text.append("AddFace" + face_text + "\n")
+        if option.use_normals:
+            vertex_template = "AddVertex, " + ", ".join([coordinate_format] * 3 + [normal_format] * 3) + "\n"
+            values = tuple(itertools.chain.from_iterable(vertex + normal for vertex, normal in vertices))
+        else:
+            vertex_template = "AddVertex, " + ", ".join([coordinate_format] * 3) + "\n"
+            values = tuple(itertools.chain.from_iterable(vertex for vertex, normal in vertices))
+
+        csv_text.append(self.compact_floats(vertex_template * len(vertices) % values))
 
-            # Diffuse color
-            csv_text.append("SetColor, " + str(mesh.diffuse_color[0]) + ", " + str(mesh.diffuse_color[1]) + ", " + str(mesh.diffuse_color[2]) + ", " + str(mesh.diffuse_color[3]) + "\n")
+        # Faces
+        for face in mesh.faces_list:
+            face_text = ""
+
+            for vertex_index in face:
+                face_text += ", " + str(vertex_index)
 
-            # Emissive color
-            if mesh.use_emissive_color:
-                csv_text.append("SetEmissiveColor, " + str(mesh.emissive_color[0]) + ", " + str(mesh.emissive_color[1]) + ", " + str(mesh.emissive_color[2]) + "\n")
+            if mesh.use_add_face2:
+                csv_text.append("AddFace2" + face_text + "\n")
+            else:
+                csv_text.append("AddFace" + face_text + "\n")
 
-            # Blend mode
-            csv_text.append("SetBlendMode, " + mesh.blend_mode + ", " + str(mesh.glow_half_distance) + ", " + mesh.glow_attenuation_mode + "\n")
+        # Diffuse color
+        csv_text.append("SetColor, " + str(mesh.diffuse_color[0]) + ", " + str(mesh.diffuse_color[1]) + ", " + str(mesh.diffuse_color[2]) + ", " + str(mesh.diffuse_color[3]) + "\n")
 
-            # Texture
-            model_dir = pathlib.Path(file_path).parent
+        # Emissive color
+        if mesh.use_emissive_color:
+            csv_text.append("SetEmissiveColor, " + str(mesh.emissive_color[0]) + ", " + str(mesh.emissive_color[1]) + ", " + str(mesh.emissive_color[2]) + "\n")
 
-            if mesh.daytime_texture_file != "" and mesh.nighttime_texture_file != "":
-                csv_text.append("LoadTexture, " + os.path.relpath(str(mesh.daytime_texture_file), str(model_dir)) + ", " + os.path.relpath(str(mesh.nighttime_texture_file), str(model_dir)) + "\n")
-            elif mesh.daytime_texture_file != "":
-                csv_text.append("LoadTexture, " + os.path.relpath(str(mesh.daytime_texture_file), str(model_dir)) + "\n")
-            elif mesh.nighttime_texture_file != "":
-                csv_text.append("LoadTexture, , " + os.path.relpath(str(mesh.nighttime_texture_file), str(model_dir)) + "\n")
+        # Blend mode
+        csv_text.append("SetBlendMode, " + mesh.blend_mode + ", " + str(mesh.glow_half_distance) + ", " + mesh.glow_attenuation_mode + "\n")
 
-            # Transparent color
-            if mesh.use_transparent_color:
-                csv_text.append("SetDecalTransparentColor, " + str(mesh.transparent_color[0]) + ", " + str(mesh.transparent_color[1]) + ", " + str(mesh.transparent_color[2]) + "\n")
+        # Texture
+        if mesh.daytime_texture_file != "" and mesh.nighttime_texture_file != "":
+            csv_text.append("LoadTexture, " + os.path.relpath(str(mesh.daytime_texture_file), str(model_dir)) + ", " + os.path.relpath(str(mesh.nighttime_texture_file), str(model_dir)) + "\n")
+        elif mesh.daytime_texture_file != "":
+            csv_text.append("LoadTexture, " + os.path.relpath(str(mesh.daytime_texture_file), str(model_dir)) + "\n")
+        elif mesh.nighttime_texture_file != "":
+            csv_text.append("LoadTexture, , " + os.path.relpath(str(mesh.nighttime_texture_file), str(model_dir)) + "\n")
 
-            # Texture coordinates
-            for texcoords in mesh.texcoords_list:
-                csv_text.append("SetTextureCoordinates, " + str(texcoords[0]) + ", " + str(texcoords[1]) + ", " + str(texcoords[2]) + "\n")
+        # Transparent color
+        if mesh.use_transparent_color:
+            csv_text.append("SetDecalTransparentColor, " + str(mesh.transparent_color[0]) + ", " + str(mesh.transparent_color[1]) + ", " + str(mesh.transparent_color[2]) + "\n")
+
+        # Texture coordinates
+        # The vertex indices are joined after compacting, since their zeros must not be trimmed.
+        texcoords_list = mesh.texcoords_list
+        texcoords_template = texcoords_format + ", " + texcoords_format + "\n"
+        uv_text = self.compact_floats(texcoords_template * len(texcoords_list) % tuple(itertools.chain.from_iterable(texcoords[1:] for texcoords in texcoords_list)))
+
+        for texcoords, uv in zip(texcoords_list, uv_text.splitlines()):
+            csv_text.append("SetTextureCoordinates, " + str(texcoords[0]) + ", " + uv + "\n")
+
+        return "".join(csv_text)
+
+    def export_csv(self, option: ExportOption, meshes_list: List[CsvMesh], file_path: str) -> None:
+        if len(meshes_list) == 0:
+            logger.error("Select one or more objects to export.")
+            return
+
+        model_dir = pathlib.Path(file_path).parent
+
+        # Each mesh is written as soon as it is formatted. The file is written under a temporary name
+        # and renamed at the end, so a partially written CSV never replaces the destination.
+        temp_path = file_path + ".tmp"
 
-        # Write file
         try:
-            with open(file_path, "wt", encoding="utf-8") as f:
-                f.writelines(csv_text)
+            with open(temp_path, "wt", encoding="utf-8", buffering=EXPORT_BUFFER_SIZE) as f:
+                # Header
+                f.write(";---------------------------------------------------------------------------\n")
+                f.write("; This file was exported from Blender by blenderCSV.\n")
+                f.write("; https://github.com/maisvendoo/blenderCSV\n")
+                f.write("; The copyright of this file belongs to the creator of the original content.\n")
+                f.write(";---------------------------------------------------------------------------\n")
+
+                # Export model
+                for mesh in meshes_list:
+                    f.write(self.format_mesh(option, mesh, model_dir))
+
+            os.replace(temp_path, file_path)
         except Exception as ex:
             logger.critical(ex)
+
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
@@ -0,0 +1,193 @@
+#    Copyright 2018, 2019 Dmirty Pritykin, 2019 S520
+#
+#    This file is part of blenderCSV.
+#
+#    blenderCSV is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    blenderCSV is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with blenderCSV.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import logging
+import marshal
+import os
+import pathlib
+import sys
+import zlib
+from typing import List, Optional, Tuple
+from . import CSV
+
+logger = logging.getLogger(__name__)
+
+# Increment when the parser output or the record layout changes.
+CACHE_FORMAT_VERSION = 3
+
+# The geometry buffers of NumpyCsvMesh and ArrayCsvMesh, which share the same names and byte layout
+BUFFER_NAMES = ("vertices", "normals", "face_indices", "face_offsets", "texcoord_indices", "texcoords")
+
+# NumPy dtype and row width of each buffer
+NUMPY_LAYOUTS = (("float64", 3), ("float64", 3), ("int32", 1), ("int32", 1), ("int32", 1), ("float64", 2))
+
+PROPERTY_NAMES = tuple(name for name in CSV.CsvMesh.__slots__ if not name.endswith("_list"))
+
+
+class LogRecorder(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__(logging.WARNING)
+        self.messages = []  # type: List[Tuple[int, str]]
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.messages.append((record.levelno, record.getMessage()))
+
+
+class CsvCache:
+    def __init__(self, cache_dir: str, max_size: int) -> None:
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.max_size = max_size
+
+    def make_key(self, option: CSV.ImportOption, file_path: str, binary: bytes) -> str:
+        stat = os.stat(file_path)
+
+        key = hashlib.sha1()
+        key.update(repr((CACHE_FORMAT_VERSION, sys.version_info[:2], str(pathlib.Path(file_path).resolve()), stat.st_size, stat.st_mtime_ns, option.use_split_add_face2, option.encoding)).encode("utf-8"))
+        key.update(hashlib.sha1(binary).digest())
+
+        return key.hexdigest()
+
+    def mesh_to_record(self, mesh: CSV.CsvMesh) -> tuple:
+        if not isinstance(mesh, (CSV.NumpyCsvMesh, CSV.ArrayCsvMesh)):
+            mesh = CSV.ArrayCsvMesh.from_mesh(mesh)
+
+        return tuple(getattr(mesh, name) for name in PROPERTY_NAMES), tuple(getattr(mesh, name).tobytes() for name in BUFFER_NAMES)
+
+    def record_to_mesh(self, option: CSV.ImportOption, record: tuple) -> CSV.CsvMesh:
+        properties, buffers = record
+
+        if option.use_numpy and CSV.numpy is not None:
+            mesh = CSV.NumpyCsvMesh()
+
+            for name, (dtype, width), buffer in zip(BUFFER_NAMES, NUMPY_LAYOUTS, buffers):
+                values = CSV.numpy.frombuffer(buffer, dtype).copy()
+                setattr(mesh, name, values.reshape(-1, width) if width > 1 else values)
+        else:
+            mesh = CSV.ArrayCsvMesh()
+
+            for name, buffer in zip(BUFFER_NAMES, buffers):
+                values = getattr(mesh, name)
+                del values[:]
+                values.frombytes(buffer)
+
+        for name, value in zip(PROPERTY_NAMES, properties):
+            setattr(mesh, name, value)
+
+        if isinstance(mesh, CSV.ArrayCsvMesh) and not option.use_compact_mesh:
+            return CSV.CsvMesh.from_mesh(mesh)
+
+        return mesh
+
+    def load(self, option: CSV.ImportOption, key: str) -> Optional[List[CSV.CsvMesh]]:
+        entry_path = self.cache_dir.joinpath(key + ".bin")
+
+        try:
+            with open(str(entry_path), "rb") as f:
+                textures, messages, records = marshal.loads(zlib.decompress(f.read()))
+
+            # Mark the entry as recently used for the LRU eviction.
+            os.utime(str(entry_path))
+        except FileNotFoundError:
+            return None
+        except Exception as ex:
+            logger.warning("Broken cache entry " + str(entry_path) + ": " + str(ex))
+            return None
+
+        # The resolved texture paths depend on which files exist, which the key does not cover.
+        resolver = CSV.TexturePathResolver()
+
+        for path, resolved in textures:
+            if resolver.find(path) != resolved:
+                logger.info("Texture files changed since cache entry " + key)
+                return None
+
+        # Repeat the warnings and errors of the parse, so that a cache hit reports the same problems.
+        for level, message in messages:
+            CSV.logger.log(level, message)
+
+        return [self.record_to_mesh(option, record) for record in records]
+
+    def store(self, key: str, meshes_list: List[CSV.CsvMesh], textures: List[Tuple[str, str]], messages: List[Tuple[int, str]]) -> None:
+        entry_path = self.cache_dir.joinpath(key + ".bin")
+        temp_path = self.cache_dir.joinpath(key + ".tmp")
+
+        try:
+            os.makedirs(str(self.cache_dir), exist_ok=True)
+
+            with open(str(temp_path), "wb") as f:
+                f.write(zlib.compress(marshal.dumps((textures, messages, [self.mesh_to_record(mesh) for mesh in meshes_list])), 1))
+
+            os.replace(str(temp_path), str(entry_path))
+        except Exception as ex:
+            logger.warning("Failed to write cache entry " + str(entry_path) + ": " + str(ex))
+            return
+
+        self.evict()
+
+    def evict(self) -> None:
+        # Remove the least recently used entries until the cache fits in max_size.
+        entries = []
+
+        for entry in os.scandir(str(self.cache_dir)):
+            if entry.name.endswith(".bin"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_size = sum(entry[1] for entry in entries)
+
+        for mtime, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+
+            try:
+                os.remove(path)
+                total_size -= size
+            except OSError as ex:
+                logger.warning(ex)
+
+    def load_csv(self, option: CSV.ImportOption, file_path: str) -> List[CSV.CsvMesh]:
+        logger.info("Loading file: " + file_path)
+
+        try:
+            with open(file_path, "rb") as f:
+                binary = f.read()
+
+            key = self.make_key(option, file_path, binary)
+        except Exception as ex:
+            logger.critical(ex)
+            return []
+
+        meshes_list = self.load(option, key)
+
+        if meshes_list is not None:
+            logger.info("Loaded from cache: " + key)
+            return meshes_list
+
+        csv_object = CSV.CsvObject()
+        recorder = LogRecorder()
+        CSV.logger.addHandler(recorder)
+
+        try:
+            meshes_list = csv_object.parse_csv(option, file_path, binary)
+        finally:
+            CSV.logger.removeHandler(recorder)
+
+        if len(meshes_list) > 0:
+            self.store(key, meshes_list, sorted(csv_object.texture_resolver.resolved.items()), recorder.messages)
+
+        return meshes_list
@@ -17,7 +17,12 @@
 
 import bpy
 import bmesh
-import filecmp
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import math
+import mathutils
 import pathlib
 import os
 import shutil
@@ -26,35 +31,341 @@ from . import CSV
 from . import logger
 from . import Transform
 
+# Records the source, size, mtime and hash of every texture copied into the <model>-textures directory
+TEXTURE_MANIFEST = "blenderCSV-manifest.json"
+
+TEXTURE_COPY_WORKERS = 4
+
 
 class ExportCsv:
     def __init__(self):
         self.file_path = ""
         self.option = CSV.ExportOption()
+        self.texture_copies = {}  # type: Dict[str, str]
+
+    def get_texture_dir(self) -> pathlib.Path:
+        return pathlib.Path(self.file_path).parent.joinpath(pathlib.Path(self.file_path).stem + "-textures")
 
     def copy_texture_separate_directory(self, model_dir: pathlib.PurePath, texture_path: pathlib.PurePath) -> str:
-        texture_dir = model_dir.joinpath(pathlib.Path(self.file_path).stem + "-textures")
+        # Only decides the destination. The files are copied once per export by copy_textures().
+        dest_path = str(model_dir.joinpath(pathlib.Path(self.file_path).stem + "-textures", texture_path.name))
+
+        if self.texture_copies.get(dest_path, str(texture_path)) != str(texture_path):
+            logger.warning("Another texture is already copied as " + dest_path + ", so " + str(texture_path) + " is referenced in place.")
+            return str(texture_path)
+
+        self.texture_copies[dest_path] = str(texture_path)
 
+        return dest_path
+
+    def load_texture_manifest(self, texture_dir: pathlib.Path) -> Dict[str, Dict]:
         try:
-            os.makedirs(str(texture_dir), exist_ok=True)
+            with open(str(texture_dir.joinpath(TEXTURE_MANIFEST)), "rt", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_texture_manifest(self, texture_dir: pathlib.Path, manifest: Dict[str, Dict]) -> None:
+        manifest_path = texture_dir.joinpath(TEXTURE_MANIFEST)
+        temp_path = texture_dir.joinpath(TEXTURE_MANIFEST + ".tmp")
+
+        try:
+            with open(str(temp_path), "wt", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=1, sort_keys=True)
+
+            os.replace(str(temp_path), str(manifest_path))
         except Exception as ex:
-            logger.critical(ex)
-            return str(texture_path)
+            logger.warning("Failed to write the texture manifest " + str(manifest_path) + ": " + str(ex))
+
+    def hash_file(self, file_path: str) -> str:
+        sha1 = hashlib.sha1()
 
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha1.update(chunk)
+
+        return sha1.hexdigest()
+
+    def copy_texture(self, source_path: str, dest_path: str, entry: Dict) -> Dict:
+        # Returns the manifest entry of the copied file, or None when it could not be copied.
+        # A file whose source is unchanged since the last export is skipped without reading it,
+        # and a file whose source only got a new mtime is skipped after comparing the hash.
         try:
-            dest_path = texture_dir.joinpath(texture_path.name)
+            stat = os.stat(source_path)
+            is_copied = entry is not None and entry.get("source") == source_path and entry.get("size") == stat.st_size and os.path.isfile(dest_path) and os.path.getsize(dest_path) == stat.st_size
+
+            if is_copied and entry.get("mtime_ns") == stat.st_mtime_ns:
+                return entry
+
+            sha1 = self.hash_file(source_path)
+
+            if not is_copied or entry.get("sha1") != sha1:
+                temp_path = dest_path + ".tmp"
+
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+                is_linked = False
+
+                if self.option.use_hardlink_textures:
+                    try:
+                        os.link(source_path, temp_path)
+                        is_linked = True
+                    except OSError as ex:
+                        logger.debug("Failed to create a hard link, copy instead: " + str(ex))
+
+                if not is_linked:
+                    shutil.copy2(source_path, temp_path)
 
-            if not os.path.exists(str(dest_path)) or not filecmp.cmp(str(texture_path), str(dest_path)):
-                shutil.copy2(str(texture_path), str(dest_path))
+                os.replace(temp_path, dest_path)
+                logger.debug("Copied texture: " + source_path + " -> " + dest_path)
 
+            return {"source": source_path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha1": sha1}
         except Exception as ex:
             logger.critical(ex)
-            return str(texture_path)
+            return None
+
+    def copy_textures(self, meshes_list: List[CSV.CsvMesh]) -> None:
+        if len(self.texture_copies) == 0:
+            return
+
+        texture_dir = self.get_texture_dir()
+        copied = set()
+
+        try:
+            os.makedirs(str(texture_dir), exist_ok=True)
+        except Exception as ex:
+            logger.critical(ex)
+        else:
+            manifest = self.load_texture_manifest(texture_dir)
+            copies = sorted(self.texture_copies.items())
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(TEXTURE_COPY_WORKERS, len(copies))) as executor:
+                entries = list(executor.map(lambda copy: self.copy_texture(copy[1], copy[0], manifest.get(pathlib.Path(copy[0]).name)), copies))
+
+            for (dest_path, source_path), entry in zip(copies, entries):
+                if entry is not None:
+                    manifest[pathlib.Path(dest_path).name] = entry
+                    copied.add(dest_path)
+
+            self.save_texture_manifest(texture_dir, manifest)
+
+        # Meshes keep referring to the original file where the copy failed.
+        for mesh in meshes_list:
+            if mesh.daytime_texture_file in self.texture_copies and mesh.daytime_texture_file not in copied:
+                mesh.daytime_texture_file = self.texture_copies[mesh.daytime_texture_file]
+
+            if mesh.nighttime_texture_file in self.texture_copies and mesh.nighttime_texture_file not in copied:
+                mesh.nighttime_texture_file = self.texture_copies[mesh.nighttime_texture_file]
+
+    def weld_vertices(self, mesh: CSV.CsvMesh, faces: List[bmesh.types.BMFace], uv_layer: bmesh.types.BMLayerItem) -> Dict[Tuple[bmesh.types.BMFace, bmesh.types.BMVert], int]:
+        # Welds face corners whose position, normal and UV all lie within weld_epsilon into one vertex.
+        # Flat faces use the face normal, so edges between them stay split.
+        # Candidates are looked up in a spatial hash of the position instead of comparing every pair.
+        epsilon = self.option.weld_epsilon
+        neighbors = list(itertools.product((-1, 0, 1), repeat=3))
+        grid = {}  # type: Dict[Tuple, List[int]]
+        welded = []  # type: List[Tuple[float, ...]]
+        vertex_indices = {}  # type: Dict[Tuple[bmesh.types.BMFace, bmesh.types.BMVert], int]
+
+        for face in faces:
+            for loop in face.loops:
+                co = (loop.vert.co[0], loop.vert.co[1], loop.vert.co[2])
+                normal = loop.vert.normal if face.smooth else face.normal
+                normal = (normal[0], normal[1], normal[2])
+                uv = (loop[uv_layer].uv[0], loop[uv_layer].uv[1]) if uv_layer is not None else ()
+                attributes = co + normal + uv
+
+                if epsilon > 0.0:
+                    cell = (math.floor(co[0] / epsilon), math.floor(co[1] / epsilon), math.floor(co[2] / epsilon))
+                    cells = [(cell[0] + i, cell[1] + j, cell[2] + k) for i, j, k in neighbors]
+                else:
+                    cell = co
+                    cells = [cell]
+
+                index = None
+
+                for c in cells:
+                    for candidate in grid.get(c, ()):
+                        if all(abs(a - b) <= epsilon for a, b in zip(welded[candidate], attributes)):
+                            index = candidate
+                            break
+
+                    if index is not None:
+                        break
+
+                if index is None:
+                    index = len(welded)
+                    welded.append(attributes)
+                    grid.setdefault(cell, []).append(index)
+                    mesh.vertex_list.append(co)
+                    mesh.normals_list.append(normal)
+
+                vertex_indices[(face, loop.vert)] = index
+
+        return vertex_indices
+
+    def group_texcoords(self, mesh: CSV.CsvMesh) -> Dict[int, List[Tuple[float, float]]]:
+        texcoords_index = {}  # type: Dict[int, List[Tuple[float, float]]]
+
+        for vertex_index, u, v in mesh.texcoords_list:
+            texcoords_index.setdefault(vertex_index, []).append((u, v))
+
+        return texcoords_index
+
+    def extract_faces(self, mesh: CSV.CsvMesh, faces_list: List[Tuple[int, ...]], texcoords_index: Dict[int, List[Tuple[float, float]]] = None) -> CSV.CsvMesh:
+        # Creates a mesh builder with the same attributes that holds only the given faces,
+        # with the vertices, normals and texcoords they use renumbered in order of appearance.
+        # Pass texcoords_index from group_texcoords() when extracting several parts of the same mesh.
+        if texcoords_index is None:
+            texcoords_index = self.group_texcoords(mesh)
+
+        sub_mesh = CSV.CsvMesh.from_mesh(mesh)
+        sub_mesh.vertex_list = []
+        sub_mesh.normals_list = []
+        sub_mesh.faces_list = []
+        sub_mesh.texcoords_list = []
+        vertex_map = {}  # type: Dict[int, int]
+
+        for face in faces_list:
+            for vertex_index in face:
+                if vertex_index not in vertex_map:
+                    new_index = len(sub_mesh.vertex_list)
+                    vertex_map[vertex_index] = new_index
+                    sub_mesh.vertex_list.append(mesh.vertex_list[vertex_index])
+
+                    if vertex_index < len(mesh.normals_list):
+                        sub_mesh.normals_list.append(mesh.normals_list[vertex_index])
+
+                    for u, v in texcoords_index.get(vertex_index, ()):
+                        sub_mesh.texcoords_list.append((new_index, u, v))
+
+            sub_mesh.faces_list.append(tuple(vertex_map[i] for i in face))
 
-        return str(dest_path)
+        return sub_mesh
+
+    def pair_add_face2(self, mesh: CSV.CsvMesh) -> List[CSV.CsvMesh]:
+        # Collapses pairs of coincident faces with opposite winding into single AddFace2 faces.
+        # A pair is only collapsed when the UVs of the two faces also match, so both sides look the same.
+        # Faces without a partner are kept in a separate builder with AddFace.
+        if mesh.use_add_face2 or len(mesh.faces_list) < 2:
+            return [mesh]
+
+        texcoords = {}  # type: Dict[int, Tuple[float, float]]
+
+        for vertex_index, u, v in mesh.texcoords_list:
+            texcoords[vertex_index] = (u, v)
+
+        corners_list = [[(mesh.vertex_list[i], texcoords.get(i)) for i in face] for face in mesh.faces_list]
+        candidates = {}  # type: Dict[Tuple, List[int]]
+        is_paired = [False] * len(corners_list)
+        is_removed = [False] * len(corners_list)
+
+        for i, corners in enumerate(corners_list):
+            key = tuple(sorted(co for co, uv in corners))
+            reversed_corners = corners[::-1]
+
+            for j in candidates.get(key, ()):
+                other = corners_list[j]
+
+                if len(other) == len(corners) and any(reversed_corners[k:] + reversed_corners[:k] == other for k in range(len(corners))):
+                    candidates[key].remove(j)
+                    is_paired[j] = True
+                    is_removed[i] = True
+                    break
+            else:
+                candidates.setdefault(key, []).append(i)
+
+        double_faces = [face for face, paired in zip(mesh.faces_list, is_paired) if paired]
+
+        if len(double_faces) == 0:
+            return [mesh]
+
+        single_faces = [face for face, paired, removed in zip(mesh.faces_list, is_paired, is_removed) if not paired and not removed]
+
+        logger.info("Paired AddFace2 faces of " + mesh.name + ": " + str(len(mesh.faces_list)) + " -> " + str(len(single_faces) + len(double_faces)))
+
+        double_mesh = self.extract_faces(mesh, double_faces)
+        double_mesh.use_add_face2 = True
+
+        if len(single_faces) == 0:
+            return [double_mesh]
+
+        double_mesh.name += ", AddFace2"
+
+        return [self.extract_faces(mesh, single_faces), double_mesh]
+
+    def morton_code(self, x: int, y: int, z: int) -> int:
+        # Interleaves the bits of three 10 bit integers.
+        code = 0
+
+        for i, n in enumerate((x, y, z)):
+            n &= 0x3ff
+            n = (n | n << 16) & 0x30000ff
+            n = (n | n << 8) & 0x300f00f
+            n = (n | n << 4) & 0x30c30c3
+            n = (n | n << 2) & 0x9249249
+            code |= n << i
+
+        return code
+
+    def split_mesh(self, mesh: CSV.CsvMesh) -> List[CSV.CsvMesh]:
+        # Splits a mesh builder with more vertices than max_vertices into several builders.
+        # Faces are sorted along a Morton curve over their centers, so that each part stays spatially compact.
+        max_vertices = self.option.max_vertices
+
+        if len(mesh.vertex_list) <= max_vertices:
+            return [mesh]
+
+        vertex_list = mesh.vertex_list
+        centers = []  # type: List[Tuple[float, float, float]]
+
+        for face in mesh.faces_list:
+            n = len(face)
+            centers.append((sum(vertex_list[i][0] for i in face) / n, sum(vertex_list[i][1] for i in face) / n, sum(vertex_list[i][2] for i in face) / n))
+
+        lower = [min(center[k] for center in centers) for k in range(3)]
+        upper = [max(center[k] for center in centers) for k in range(3)]
+        scale = [1023.0 / (upper[k] - lower[k]) if upper[k] > lower[k] else 0.0 for k in range(3)]
+
+        codes = [self.morton_code(int((center[0] - lower[0]) * scale[0]), int((center[1] - lower[1]) * scale[1]), int((center[2] - lower[2]) * scale[2])) for center in centers]
+        order = sorted(range(len(mesh.faces_list)), key=codes.__getitem__)
+
+        # Fill each part with faces until the next one would bring it over the limit.
+        # A face with more vertices than the limit gets a part of its own.
+        parts = [[]]  # type: List[List[Tuple[int, ...]]]
+        part_vertices = set()
+
+        for face_index in order:
+            face = mesh.faces_list[face_index]
+            new_vertices = set(face) - part_vertices
+
+            if len(part_vertices) + len(new_vertices) > max_vertices and len(parts[-1]) > 0:
+                parts.append([])
+                part_vertices = set()
+                new_vertices = set(face)
+
+            if len(new_vertices) > max_vertices:
+                logger.warning("A face of " + mesh.name + " has " + str(len(new_vertices)) + " vertices, more than the limit of " + str(max_vertices) + ".")
+
+            part_vertices |= new_vertices
+            parts[-1].append(face)
+
+        texcoords_index = self.group_texcoords(mesh)
+        meshes_list = []  # type: List[CSV.CsvMesh]
+
+        for i, faces in enumerate(parts):
+            sub_mesh = self.extract_faces(mesh, faces, texcoords_index)
+            sub_mesh.name += ", Part: " + str(i + 1) + "/" + str(len(parts))
+            meshes_list.append(sub_mesh)
+
+        logger.info("Split " + mesh.name + " into " + str(len(parts)) + " parts with up to " + str(max_vertices) + " vertices.")
+
+        return meshes_list
 
     def export_model(self, file_path: str) -> None:
         self.file_path = file_path
+        self.texture_copies = {}
 
         meshes_list = []  # type: List[CSV.CsvMesh]
 
@@ -69,7 +380,13 @@ class ExportCsv:
             blender_mesh = bmesh.new()
             blender_mesh.from_mesh(obj.data)
 
-            Transform.swap_coordinate_system(obj.matrix_world, blender_mesh, self.option.use_transform_coords)
+            # Compose the global scale into the world matrix, so the vertices are transformed only once.
+            matrix_world = obj.matrix_world
+
+            if self.option.global_mesh_scale != 1.0:
+                matrix_world = mathutils.Matrix.Scale(self.option.global_mesh_scale, 4) * matrix_world
+
+            Transform.swap_coordinate_system(matrix_world, blender_mesh, self.option.use_transform_coords)
 
             # Group faces by material index.
             blender_faces = {}  # type: Dict[int, List[bmesh.types.BMFace]]
@@ -80,41 +397,59 @@ class ExportCsv:
 
                 blender_faces[face.material_index].append(face)
 
-            for m_idx, faces in blender_faces.items():
+            # Material slots are exported in order, so the mesh builders of a merged import come back in their original order.
+            for m_idx, faces in sorted(blender_faces.items()):
                 # Create a new CsvMesh.
                 mesh = CSV.CsvMesh()
                 mesh.name = "Mesh: " + obj.data.name
 
                 # Add vertices to mesh
-                blender_vertices = []  # type: List[Tuple[bmesh.types.BMFace, bmesh.types.BMVert]]
+                if self.option.use_weld_vertices:
+                    vertex_indices = self.weld_vertices(mesh, faces, blender_mesh.loops.layers.uv.active)
 
-                for face in faces:
-                    for vertex in face.verts:
-                        if (face, vertex) not in blender_vertices:
-                            blender_vertices.append((face, vertex))
+                    logger.info("Welded vertices of " + mesh.name + ": " + str(len(vertex_indices)) + " -> " + str(len(mesh.vertex_list)))
+                else:
+                    blender_vertices = []  # type: List[Tuple[bmesh.types.BMFace, bmesh.types.BMVert]]
+                    vertex_indices = {}
 
-                for vertex in blender_vertices:
-                    mesh.vertex_list.append((vertex[1].co[0], vertex[1].co[1], vertex[1].co[2]))
-                    mesh.normals_list.append((vertex[1].normal[0], vertex[1].normal[1], vertex[1].normal[2]))
+                    for face in faces:
+                        for vertex in face.verts:
+                            if (face, vertex) not in vertex_indices:
+                                vertex_indices[(face, vertex)] = len(blender_vertices)
+                                blender_vertices.append((face, vertex))
+
+                    for vertex in blender_vertices:
+                        mesh.vertex_list.append((vertex[1].co[0], vertex[1].co[1], vertex[1].co[2]))
+                        mesh.normals_list.append((vertex[1].normal[0], vertex[1].normal[1], vertex[1].normal[2]))
 
                 # Add faces to mesh
                 for face in faces:
                     indices = []  # type: List[int]
 
                     for vertex in face.verts:
-                        indices.append(blender_vertices.index((face, vertex)))
+                        indices.append(vertex_indices[(face, vertex)])
 
                     mesh.faces_list.append(tuple(indices))
 
                 # Add texcoords to mesh
                 if blender_mesh.loops.layers.uv.active is not None:
+                    tolerance = self.option.texcoords_tolerance
+                    texcoords_keys = set()
+
                     for face in faces:
                         for loop in face.loops:
-                            vertex_index = blender_vertices.index((face, loop.vert))
+                            vertex_index = vertex_indices[(face, loop.vert)]
                             uv = loop[blender_mesh.loops.layers.uv.active].uv
                             texcoords = (vertex_index, uv[0], 1.0 - uv[1])
 
-                            if texcoords not in mesh.texcoords_list:
+                            # With a tolerance, UVs falling in the same grid cell are merged into the first one seen.
+                            if tolerance > 0.0:
+                                key = (vertex_index, round(texcoords[1] / tolerance), round(texcoords[2] / tolerance))
+                            else:
+                                key = texcoords
+
+                            if key not in texcoords_keys:
+                                texcoords_keys.add(key)
                                 mesh.texcoords_list.append(texcoords)
 
                 # Add material to mesh
@@ -155,15 +490,30 @@ class ExportCsv:
                     mesh.name += ", Material: Undefined"
 
                 # Set options to mesh
-                mesh.use_emissive_color = obj.csv_props.use_emissive_color
-                mesh.emissive_color = (round(obj.csv_props.emissive_color[0] * 255), round(obj.csv_props.emissive_color[1] * 255), round(obj.csv_props.emissive_color[2] * 255))
-                mesh.blend_mode = obj.csv_props.blend_mode
-                mesh.glow_half_distance = obj.csv_props.glow_half_distance
-                mesh.glow_attenuation_mode = obj.csv_props.glow_attenuation_mode
-                mesh.use_transparent_color = obj.csv_props.use_transparent_color
-                mesh.transparent_color = (round(obj.csv_props.transparent_color[0] * 255), round(obj.csv_props.transparent_color[1] * 255), round(obj.csv_props.transparent_color[2] * 255))
+                # A material can override the object's options, as a merged import does for each mesh builder.
+                props = obj.csv_props
+                mat = obj.material_slots[m_idx].material if m_idx < len(obj.material_slots) else None
+
+                if mat is not None and mat.csv_props.use_mesh_props:
+                    props = mat.csv_props.mesh_props
+
+                mesh.use_emissive_color = props.use_emissive_color
+                mesh.emissive_color = (round(props.emissive_color[0] * 255), round(props.emissive_color[1] * 255), round(props.emissive_color[2] * 255))
+                mesh.blend_mode = props.blend_mode
+                mesh.glow_half_distance = props.glow_half_distance
+                mesh.glow_attenuation_mode = props.glow_attenuation_mode
+                mesh.use_transparent_color = props.use_transparent_color
+                mesh.transparent_color = (round(props.transparent_color[0] * 255), round(props.transparent_color[1] * 255), round(props.transparent_color[2] * 255))
 
                 # Finalize
-                meshes_list.append(mesh)
+                if self.option.use_pair_add_face2:
+                    builders = self.pair_add_face2(mesh)
+                else:
+                    builders = [mesh]
+
+                for builder in builders:
+                    meshes_list.extend(self.split_mesh(builder))
+
+        self.copy_textures(meshes_list)
 
         CSV.CsvObject().export_csv(self.option, meshes_list, self.file_path)
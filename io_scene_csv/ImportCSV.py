@@ -15,12 +15,32 @@
 #    You should have received a copy of the GNU General Public License
 #    along with blenderCSV.  If not, see <http://www.gnu.org/licenses/>.
 
+import array
 import bpy
+import itertools
+import logging
 import pathlib
 import mathutils
+import os
 from . import CSV
+from . import CSVCache
 from . import logger
 from . import Transform
+from typing import Dict, List, Tuple
+
+# Maps the fingerprint of a material to the material. Shared by all imports of the session.
+material_index = None  # type: Dict[Tuple, bpy.types.Material]
+
+# Maps the absolute path of an image to the texture using it. Shared by all imports of the session.
+texture_cache = None  # type: Dict[str, bpy.types.ImageTexture]
+
+
+@bpy.app.handlers.persistent
+def clear_session_caches(*args) -> None:
+    # Undo, redo and loading a .blend file reallocate every ID, which leaves the cached references dangling.
+    global material_index, texture_cache
+    material_index = None
+    texture_cache = None
 
 
 class ImportCsv:
@@ -29,43 +49,119 @@ class ImportCsv:
     def __init__(self):
         self.file_path = ""
         self.option = CSV.ImportOption()
+        self.texture_requests = 0
+        self.texture_hits = 0
 
-    def get_same_material(self, csv_mesh: CSV.CsvMesh, mat_name: str) -> bpy.types.Material:
-        mat = bpy.data.materials.get(mat_name)
-
-        if mat is None:
-            return None
+    def get_mesh_fingerprint(self, csv_mesh: CSV.CsvMesh, use_mesh_props: bool = False) -> Tuple:
+        if use_mesh_props:
+            mesh_props = (csv_mesh.use_emissive_color, tuple(csv_mesh.emissive_color), csv_mesh.blend_mode, csv_mesh.glow_half_distance, csv_mesh.glow_attenuation_mode, csv_mesh.use_transparent_color, tuple(csv_mesh.transparent_color))
+        else:
+            mesh_props = None
 
-        if mat.diffuse_color[0] != csv_mesh.diffuse_color[0] * self.INV255 or mat.diffuse_color[1] != csv_mesh.diffuse_color[1] * self.INV255 or mat.diffuse_color[2] != csv_mesh.diffuse_color[2] * self.INV255:
-            return None
+        return (tuple(csv_mesh.diffuse_color), self.get_texture_key(csv_mesh.daytime_texture_file), self.get_texture_key(csv_mesh.nighttime_texture_file), csv_mesh.use_add_face2, mesh_props)
 
-        if csv_mesh.daytime_texture_file == "" and mat.alpha != csv_mesh.diffuse_color[3] * self.INV255:
-            return None
+    def get_material_fingerprint(self, mat: bpy.types.Material) -> Tuple:
+        # The same fingerprint as get_mesh_fingerprint() gives for the mesh the material was created from.
+        daytime_texture_file = ""
+        alpha = mat.alpha
 
         if mat.active_texture_index < len(mat.texture_slots):
             slot = mat.texture_slots[mat.active_texture_index]
 
-            if slot is None:
-                return None
+            if slot is not None and type(slot.texture) is bpy.types.ImageTexture and slot.texture.image is not None:
+                daytime_texture_file = self.get_texture_key(slot.texture.image.filepath)
+                alpha = slot.alpha_factor
 
-            if type(slot.texture) is not bpy.types.ImageTexture:
-                return None
+        diffuse_color = (round(mat.diffuse_color[0] * 255), round(mat.diffuse_color[1] * 255), round(mat.diffuse_color[2] * 255), round(alpha * 255))
 
-            if slot.texture.image.filepath != csv_mesh.daytime_texture_file:
-                return None
+        if mat.csv_props.use_mesh_props:
+            props = mat.csv_props.mesh_props
+            mesh_props = (props.use_emissive_color, tuple(round(c * 255) for c in props.emissive_color), props.blend_mode, props.glow_half_distance, props.glow_attenuation_mode, props.use_transparent_color, tuple(round(c * 255) for c in props.transparent_color))
+        else:
+            mesh_props = None
+
+        return (diffuse_color, daytime_texture_file, self.get_texture_key(mat.csv_props.nighttime_texture_file), mat.csv_props.use_add_face2, mesh_props)
+
+    def build_material_index(self) -> None:
+        global material_index
+        material_index = {}
+
+        for mat in bpy.data.materials:
+            material_index.setdefault(self.get_material_fingerprint(mat), mat)
+
+    def get_same_material(self, csv_mesh: CSV.CsvMesh, use_mesh_props: bool = False) -> bpy.types.Material:
+        if material_index is None:
+            self.build_material_index()
 
-            if slot.alpha_factor != csv_mesh.diffuse_color[3] * self.INV255:
+        fingerprint = self.get_mesh_fingerprint(csv_mesh, use_mesh_props)
+
+        for retry in range(2):
+            mat = material_index.get(fingerprint)
+
+            if mat is None:
                 return None
 
-        if mat.csv_props.use_add_face2 != csv_mesh.use_add_face2:
-            return None
+            # The material may have been removed or edited since it was indexed.
+            try:
+                if self.get_material_fingerprint(mat) == fingerprint:
+                    return mat
+            except ReferenceError:
+                pass
+
+            self.build_material_index()
+
+        return None
 
-        if mat.csv_props.nighttime_texture_file != csv_mesh.nighttime_texture_file:
-            return None
+    def get_texture_key(self, file_path: str) -> str:
+        # Paths may be relative to the .blend file ("//") and differ in case or separators on Windows.
+        if file_path == "":
+            return ""
 
-        return mat
+        return os.path.normcase(os.path.abspath(bpy.path.abspath(file_path)))
 
-    def create_material(self, csv_mesh: CSV.CsvMesh, blender_mesh: bpy.types.Mesh) -> None:
+    def build_texture_cache(self) -> None:
+        global texture_cache
+        texture_cache = {}
+
+        for texture in bpy.data.textures:
+            if type(texture) is bpy.types.ImageTexture and texture.image is not None and texture.image.filepath != "":
+                texture_cache.setdefault(self.get_texture_key(texture.image.filepath), texture)
+
+    def get_texture(self, file_path: str, texture_name: str) -> bpy.types.ImageTexture:
+        # Each image file is loaded once and shared by one texture, whichever name it is referenced under.
+        if texture_cache is None:
+            self.build_texture_cache()
+
+        key = self.get_texture_key(file_path)
+        texture = texture_cache.get(key)
+        self.texture_requests += 1
+
+        # The texture or its image may have been removed or replaced since it was cached.
+        try:
+            if texture is not None and texture.image is not None and self.get_texture_key(texture.image.filepath) == key:
+                self.texture_hits += 1
+                return texture
+        except ReferenceError:
+            pass
+
+        texture = bpy.data.textures.new(texture_name, "IMAGE")
+        texture.image = bpy.data.images.load(file_path, check_existing=True)
+        texture_cache[key] = texture
+
+        return texture
+
+    def set_mesh_props(self, props: bpy.types.PropertyGroup, csv_mesh: CSV.CsvMesh) -> None:
+        props.use_emissive_color = csv_mesh.use_emissive_color
+        props.emissive_color = (csv_mesh.emissive_color[0] * self.INV255, csv_mesh.emissive_color[1] * self.INV255, csv_mesh.emissive_color[2] * self.INV255)
+        props.blend_mode = csv_mesh.blend_mode
+        props.glow_half_distance = csv_mesh.glow_half_distance
+        props.glow_attenuation_mode = csv_mesh.glow_attenuation_mode
+        props.use_transparent_color = csv_mesh.use_transparent_color
+        props.transparent_color = (csv_mesh.transparent_color[0] * self.INV255, csv_mesh.transparent_color[1] * self.INV255, csv_mesh.transparent_color[2] * self.INV255)
+
+    def create_material(self, csv_mesh: CSV.CsvMesh, blender_mesh: bpy.types.Mesh, use_mesh_props: bool = False) -> None:
+        # With use_mesh_props, the properties of the mesh builder that are otherwise set on the object
+        # are stored in the material, so that several builders can share one object.
         # Decide the name of the material. If a texture file exists, use that file name.
         if csv_mesh.daytime_texture_file != "":
             mat_name = pathlib.Path(csv_mesh.daytime_texture_file).stem
@@ -73,7 +169,7 @@ class ImportCsv:
             mat_name = blender_mesh.name
 
         # Check if the same material already exists.
-        mat = self.get_same_material(csv_mesh, mat_name)
+        mat = self.get_same_material(csv_mesh, use_mesh_props)
 
         # Since the same material does not exist, create a new one.
         if mat is None:
@@ -86,11 +182,7 @@ class ImportCsv:
 
             # Set the texture on the material.
             if csv_mesh.daytime_texture_file != "":
-                texture = bpy.data.textures.get(mat_name)
-
-                if texture is None:
-                    texture = bpy.data.textures.new(mat_name, "IMAGE")
-                    texture.image = bpy.data.images.load(csv_mesh.daytime_texture_file)
+                texture = self.get_texture(csv_mesh.daytime_texture_file, mat_name)
 
                 slot = mat.texture_slots.add()
                 slot.texture = texture
@@ -105,63 +197,224 @@ class ImportCsv:
             mat.csv_props.use_add_face2 = csv_mesh.use_add_face2
             mat.csv_props.nighttime_texture_file = csv_mesh.nighttime_texture_file
 
+            if use_mesh_props:
+                mat.csv_props.use_mesh_props = True
+                self.set_mesh_props(mat.csv_props.mesh_props, csv_mesh)
+
+            material_index[self.get_mesh_fingerprint(csv_mesh, use_mesh_props)] = mat
+
         # Set the material on the mesh.
         blender_mesh.materials.append(mat)
 
-    def set_texcoords(self, csv_mesh: CSV.CsvMesh, blender_mesh: bpy.types.Mesh) -> None:
+    def get_texcoords(self, csv_mesh: CSV.CsvMesh, vertex_offset: int, texcoords: Dict[int, Tuple[float, float]]) -> None:
+        # When SetTextureCoordinates is repeated for a vertex, the last one wins.
+        for vert_idx, x, y in csv_mesh.texcoords_list:
+            texcoords[vertex_offset + vert_idx] = (x, 1.0 - y)
+
+    def set_texcoords(self, texcoords: Dict[int, Tuple[float, float]], blender_mesh: bpy.types.Mesh) -> None:
         blender_mesh.uv_textures.new("default")
+        uv_layer = blender_mesh.uv_layers["default"]
+
+        loop_vertices = array.array("i", [0]) * len(blender_mesh.loops)
+        blender_mesh.loops.foreach_get("vertex_index", loop_vertices)
+
+        uvs = array.array("f", [0.0]) * (2 * len(loop_vertices))
+        uv_layer.data.foreach_get("uv", uvs)
+
+        undefined_vertices = set()
+
+        for loop_idx, vert_idx in enumerate(loop_vertices):
+            uv = texcoords.get(vert_idx)
+
+            if uv is None:
+                undefined_vertices.add(vert_idx)
+                continue
+
+            uvs[2 * loop_idx] = uv[0]
+            uvs[2 * loop_idx + 1] = uv[1]
+
+        uv_layer.data.foreach_set("uv", uvs)
 
-        for face in blender_mesh.polygons:
-            for vert_idx, loop_idx in zip(face.vertices, face.loop_indices):
-                try:
-                    texcoords = [j for j in csv_mesh.texcoords_list if j[0] == vert_idx][0]
-                except Exception:
-                    logger.error("VertexIndex: " + str(vert_idx) + " is not defined with the SetTextureCoordinates command.")
-                    continue
+        if len(undefined_vertices) > 0:
+            logger.error(str(len(undefined_vertices)) + " vertices of " + blender_mesh.name + " are not defined with the SetTextureCoordinates command. VertexIndex: " + ", ".join(str(i) for i in sorted(undefined_vertices)[:10]) + (", ..." if len(undefined_vertices) > 10 else ""))
 
-                blender_mesh.uv_layers["default"].data[loop_idx].uv = [texcoords[1], 1.0 - texcoords[2]]
+    def get_mesh_buffers(self, csv_mesh: CSV.CsvMesh, is_swap: bool) -> Tuple[array.array, array.array, array.array, array.array]:
+        # Returns the flat co, vertex_index, loop_start and loop_total buffers of the mesh.
+        # When is_swap is set, Y and Z are swapped and the faces are flipped the way Mesh.flip_normals() does,
+        # keeping the first vertex of each face.
+        if CSV.numpy is not None and type(csv_mesh) is CSV.NumpyCsvMesh:
+            numpy = CSV.numpy
+            vertices = csv_mesh.vertices[:, (0, 2, 1)] if is_swap else csv_mesh.vertices
+            loop_starts = csv_mesh.face_offsets[:-1]
+            loop_totals = numpy.diff(csv_mesh.face_offsets)
+            loop_vertices = csv_mesh.face_indices
+
+            if is_swap and len(loop_vertices) > 0:
+                face_starts = numpy.repeat(loop_starts, loop_totals)
+                face_totals = numpy.repeat(loop_totals, loop_totals)
+                loop_vertices = loop_vertices[face_starts + (face_starts + face_totals - numpy.arange(len(loop_vertices))) % face_totals]
+
+            return (array.array("f", vertices.astype(numpy.float32).ravel().tobytes()),
+                    array.array("i", loop_vertices.astype(numpy.int32).tobytes()),
+                    array.array("i", loop_starts.astype(numpy.int32).tobytes()),
+                    array.array("i", loop_totals.astype(numpy.int32).tobytes()))
+
+        if type(csv_mesh) is CSV.ArrayCsvMesh:
+            vertices = csv_mesh.vertices
+            indices = csv_mesh.face_indices
+            offsets = csv_mesh.face_offsets
+        else:
+            vertices = array.array("d", itertools.chain.from_iterable(csv_mesh.vertex_list))
+            indices = array.array("I", itertools.chain.from_iterable(csv_mesh.faces_list))
+            offsets = array.array("I", (0,))
+            offsets.extend(itertools.accumulate(len(face) for face in csv_mesh.faces_list))
+
+        if is_swap:
+            co = array.array("f", vertices)
+            co[1::3], co[2::3] = co[2::3], co[1::3]
+            loop_vertices = array.array("i", itertools.chain.from_iterable(itertools.chain(indices[offsets[i]:offsets[i] + 1], reversed(indices[offsets[i] + 1:offsets[i + 1]])) for i in range(len(offsets) - 1)))
+        else:
+            co = array.array("f", vertices)
+            loop_vertices = array.array("i", indices)
+
+        loop_starts = array.array("i", offsets[:-1])
+        loop_totals = array.array("i", (offsets[i + 1] - offsets[i] for i in range(len(offsets) - 1)))
+
+        return co, loop_vertices, loop_starts, loop_totals
+
+    def build_mesh(self, csv_mesh: CSV.CsvMesh, blender_mesh: bpy.types.Mesh) -> None:
+        blender_mesh.from_pydata(csv_mesh.vertex_list, [], csv_mesh.faces_list)
+        blender_mesh.update(True)
+
+        self.create_material(csv_mesh, blender_mesh)
+
+        texcoords = {}  # type: Dict[int, Tuple[float, float]]
+        self.get_texcoords(csv_mesh, 0, texcoords)
+        self.set_texcoords(texcoords, blender_mesh)
+
+        Transform.swap_coordinate_system(mathutils.Matrix.Identity(4), blender_mesh, self.option.use_transform_coords)
+
+    def build_geometry(self, blender_mesh: bpy.types.Mesh, buffers: Tuple[array.array, array.array, array.array, array.array], material_indices: array.array = None) -> None:
+        # Fills the mesh from flat buffers with foreach_set instead of from_pydata.
+        # The coordinate system is swapped in the buffers, so no per-vertex transform is needed afterwards.
+        co, loop_vertices, loop_starts, loop_totals = buffers
+
+        blender_mesh.vertices.add(len(co) // 3)
+        blender_mesh.loops.add(len(loop_vertices))
+        blender_mesh.polygons.add(len(loop_totals))
+
+        blender_mesh.vertices.foreach_set("co", co)
+        blender_mesh.loops.foreach_set("vertex_index", loop_vertices)
+        blender_mesh.polygons.foreach_set("loop_start", loop_starts)
+        blender_mesh.polygons.foreach_set("loop_total", loop_totals)
+
+        if material_indices is not None:
+            blender_mesh.polygons.foreach_set("material_index", material_indices)
+
+        blender_mesh.update(calc_edges=True)
+
+        if blender_mesh.validate():
+            logger.warning("Invalid geometry was removed from " + blender_mesh.name)
+
+    def build_mesh_bulk(self, csv_mesh: CSV.CsvMesh, blender_mesh: bpy.types.Mesh, buffers: Tuple[array.array, array.array, array.array, array.array]) -> None:
+        self.build_geometry(blender_mesh, buffers)
+
+        self.create_material(csv_mesh, blender_mesh)
+
+        texcoords = {}  # type: Dict[int, Tuple[float, float]]
+        self.get_texcoords(csv_mesh, 0, texcoords)
+        self.set_texcoords(texcoords, blender_mesh)
+
+    def import_merged_model(self, meshes_list: List[CSV.CsvMesh], obj_name: str) -> None:
+        # Merges all mesh builders of the file into one mesh, built in a single bulk construction.
+        # Each builder gets its own material slot, and its properties are stored in the material.
+        co = array.array("f")
+        loop_vertices = array.array("i")
+        loop_starts = array.array("i")
+        loop_totals = array.array("i")
+        material_indices = array.array("i")
+        texcoords = {}  # type: Dict[int, Tuple[float, float]]
+
+        for i, csv_mesh in enumerate(meshes_list):
+            buffers = self.get_mesh_buffers(csv_mesh, self.option.use_transform_coords)
+            vertex_offset = len(co) // 3
+            loop_offset = len(loop_vertices)
+
+            logger.info("Loaded mesh" + str(i) + ": (Vertex: " + str(len(buffers[0]) // 3) + ", Face: " + str(len(buffers[3])) + ")")
+
+            co.extend(buffers[0])
+            loop_vertices.extend(vertex_offset + j for j in buffers[1])
+            loop_starts.extend(loop_offset + j for j in buffers[2])
+            loop_totals.extend(buffers[3])
+            material_indices.extend(array.array("i", [i]) * len(buffers[3]))
+
+            self.get_texcoords(csv_mesh, vertex_offset, texcoords)
+
+        blender_mesh = bpy.data.meshes.new(obj_name)
+        self.build_geometry(blender_mesh, (co, loop_vertices, loop_starts, loop_totals), material_indices)
+
+        for csv_mesh in meshes_list:
+            self.create_material(csv_mesh, blender_mesh, True)
+
+        self.set_texcoords(texcoords, blender_mesh)
+
+        blender_mesh.calc_normals()
+
+        obj = bpy.data.objects.new(blender_mesh.name, blender_mesh)
+        obj.select = True
+
+        bpy.context.scene.objects.link(obj)
 
     def import_model(self, file_path: str) -> None:
         self.file_path = file_path
 
-        meshes_list = CSV.CsvObject().load_csv(self.option, file_path)
+        if self.option.use_cache:
+            meshes_list = CSVCache.CsvCache(self.option.cache_dir, self.option.cache_max_size).load_csv(self.option, file_path)
+        else:
+            meshes_list = CSV.CsvObject().load_csv(self.option, file_path)
 
         logger.info("Loaded meshes: " + str(len(meshes_list)))
 
-        for i in range(len(meshes_list)):
-            logger.info("Loaded mesh" + str(i) + ": (Vertex: " + str(len(meshes_list[i].vertex_list)) + ", Face: " + str(len(meshes_list[i].faces_list)) + ")")
+        # A missing or unreadable file yields no meshes, and no object is created for it.
+        if len(meshes_list) == 0:
+            return
 
-            for j in range(len(meshes_list[i].vertex_list)):
-                logger.debug("Vertex" + str(j) + ": " + str(meshes_list[i].vertex_list[j]))
+        obj_base_name = pathlib.Path(self.file_path).stem
 
-            for j in range(len(meshes_list[i].faces_list)):
-                logger.debug("Face" + str(j) + ": " + str(meshes_list[i].faces_list[j]))
-                pass
+        if self.option.use_merge_meshes:
+            self.import_merged_model(meshes_list, obj_base_name)
+        else:
+            for i in range(len(meshes_list)):
+                buffers = self.get_mesh_buffers(meshes_list[i], self.option.use_transform_coords)
+                vertex_count = len(buffers[0]) // 3
 
-        obj_base_name = pathlib.Path(self.file_path).stem
+                logger.info("Loaded mesh" + str(i) + ": (Vertex: " + str(vertex_count) + ", Face: " + str(len(buffers[3])) + ")")
+
+                if logger.isEnabledFor(logging.DEBUG):
+                    vertex_list = meshes_list[i].vertex_list
+                    faces_list = meshes_list[i].faces_list
+
+                    for j in range(len(vertex_list)):
+                        logger.debug("Vertex" + str(j) + ": " + str(vertex_list[j]))
 
-        for i in range(len(meshes_list)):
-            blender_mesh = bpy.data.meshes.new(str(obj_base_name) + " - " + str(i))
-            blender_mesh.from_pydata(meshes_list[i].vertex_list, [], meshes_list[i].faces_list)
-            blender_mesh.update(True)
+                    for j in range(len(faces_list)):
+                        logger.debug("Face" + str(j) + ": " + str(faces_list[j]))
 
-            self.create_material(meshes_list[i], blender_mesh)
+                blender_mesh = bpy.data.meshes.new(str(obj_base_name) + " - " + str(i))
 
-            self.set_texcoords(meshes_list[i], blender_mesh)
+                if vertex_count >= self.option.bulk_mesh_threshold:
+                    self.build_mesh_bulk(meshes_list[i], blender_mesh, buffers)
+                else:
+                    self.build_mesh(meshes_list[i], blender_mesh)
 
-            Transform.swap_coordinate_system(mathutils.Matrix.Identity(4), blender_mesh, self.option.use_transform_coords)
+                blender_mesh.calc_normals()
 
-            blender_mesh.calc_normals()
+                obj = bpy.data.objects.new(blender_mesh.name, blender_mesh)
+                obj.select = True
 
-            obj = bpy.data.objects.new(blender_mesh.name, blender_mesh)
-            obj.select = True
+                self.set_mesh_props(obj.csv_props, meshes_list[i])
 
-            obj.csv_props.use_emissive_color = meshes_list[i].use_emissive_color
-            obj.csv_props.emissive_color = (meshes_list[i].emissive_color[0] * self.INV255, meshes_list[i].emissive_color[1] * self.INV255, meshes_list[i].emissive_color[2] * self.INV255)
-            obj.csv_props.blend_mode = meshes_list[i].blend_mode
-            obj.csv_props.glow_half_distance = meshes_list[i].glow_half_distance
-            obj.csv_props.glow_attenuation_mode = meshes_list[i].glow_attenuation_mode
-            obj.csv_props.use_transparent_color = meshes_list[i].use_transparent_color
-            obj.csv_props.transparent_color = (meshes_list[i].transparent_color[0] * self.INV255, meshes_list[i].transparent_color[1] * self.INV255, meshes_list[i].transparent_color[2] * self.INV255)
+                bpy.context.scene.objects.link(obj)
 
-            bpy.context.scene.objects.link(obj)
+        if self.texture_requests > 0:
+            logger.info("Texture cache: " + str(self.texture_hits) + " hits of " + str(self.texture_requests) + " (" + str(round(100.0 * self.texture_hits / self.texture_requests)) + "%)")
@@ -20,6 +20,29 @@ import bmesh
 import mathutils
 from typing import Union
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def transform_vertices(mesh: bpy.types.Mesh, co_mat: mathutils.Matrix, normal_mat: mathutils.Matrix) -> None:
+    # Transforms all coordinates and normals with foreach_get/foreach_set.
+    # The arithmetic is done in single precision, as mathutils does.
+    n = len(mesh.vertices)
+    m = numpy.array(co_mat, numpy.float32)
+    r = numpy.array(normal_mat, numpy.float32)
+
+    co = numpy.empty(n * 3, numpy.float32)
+    mesh.vertices.foreach_get("co", co)
+    co = numpy.dot(co.reshape(n, 3), m[:3, :3].T) + m[:3, 3]
+    mesh.vertices.foreach_set("co", co.ravel())
+
+    normals = numpy.empty(n * 3, numpy.float32)
+    mesh.vertices.foreach_get("normal", normals)
+    normals = numpy.dot(normals.reshape(n, 3), r.T)
+    mesh.vertices.foreach_set("normal", normals.ravel())
+
 
 def swap_coordinate_system(matrix_world: mathutils.Matrix, mesh: Union[bpy.types.Mesh, bmesh.types.BMesh], is_swap: bool) -> None:
     swap_mat = mathutils.Matrix.Identity(4)
@@ -30,21 +53,30 @@ def swap_coordinate_system(matrix_world: mathutils.Matrix, mesh: Union[bpy.types
         swap_mat[2][0], swap_mat[2][1], swap_mat[2][2], swap_mat[2][3] = 0, 1, 0, 0
         swap_mat[3][0], swap_mat[3][1], swap_mat[3][2], swap_mat[3][3] = 0, 0, 0, 1
 
-    trans, rot, scale = matrix_world.decompose()
+    # Compute the combined matrices once instead of for every vertex.
+    co_mat = swap_mat * matrix_world
+    normal_mat = co_mat.to_3x3().normalized()
+
+    if co_mat == mathutils.Matrix.Identity(4):
+        return
 
     if type(mesh) is bpy.types.Mesh:
-        for vertex in mesh.vertices:
-            vertex.co = swap_mat * matrix_world * vertex.co
-            vertex.normal = (swap_mat * matrix_world).to_3x3().normalized() * vertex.normal
+        if numpy is not None:
+            transform_vertices(mesh, co_mat, normal_mat)
+        else:
+            for vertex in mesh.vertices:
+                vertex.co = co_mat * vertex.co
+                vertex.normal = normal_mat * vertex.normal
 
         if is_swap:
             mesh.flip_normals()
 
     if type(mesh) is bmesh.types.BMesh:
+        bmesh.ops.transform(mesh, matrix=co_mat, verts=mesh.verts)
+
+        # BMesh has no bulk access to the vertex normals.
         for vertex in mesh.verts:
-            vertex.co = swap_mat * matrix_world * vertex.co
-            vertex.normal = (swap_mat * matrix_world).to_3x3().normalized() * vertex.normal
+            vertex.normal = normal_mat * vertex.normal
 
         if is_swap:
-            for face in mesh.faces:
-                face.normal_flip()
+            bmesh.ops.reverse_faces(mesh, faces=mesh.faces)